@@ -1,5 +1,7 @@
+import json
+
 from flask_restx import Resource, fields
-from flask import request
+from flask import request, Response, stream_with_context
 from config.token_config import token_required
 from services.chat_service import ChatService
 
@@ -7,6 +9,8 @@ from services.chat_service import ChatService
 def chat_controller(api):
     # Initialize ChatService once for the entire controller (lazy initialization)
     chat_service = ChatService()
+    # Exposed for startup warm-up
+    api.app.extensions["chat_service"] = chat_service
     chat_ns = api.namespace('Chat', 
                             description='RAG-powered Chat API with Vector Search and Gemini Integration', 
                             path='/api/chat')
@@ -16,13 +20,17 @@ def chat_controller(api):
         'document_ids': fields.List(fields.String, required=False, description='List of document IDs for filtering (optional)'),
         'video_ids': fields.List(fields.String, required=False, description='List of video IDs for filtering (optional)'),
         'question': fields.String(required=True, description='User question to be answered'),
-        'conversation_id': fields.String(required=False, description='Conversation ID for maintaining chat context (optional)')
+        'conversation_id': fields.String(required=False, description='Conversation ID for maintaining chat context (optional)'),
+        'retrieval': fields.String(required=False, enum=['auto', 'always', 'never'],
+                                   description='Override the retrieval router: always / never search the knowledge base (optional)')
     })
     
     # Response models
     source_model = chat_ns.model('Source', {
         'chunk_id': fields.String(description='ID of the source document chunk'),
         'similarity': fields.Float(description='Similarity score (0-1)'),
+        'timestamp_start': fields.Float(description='Video sources: seek offset (seconds) where the chunk starts'),
+        'timestamp_end': fields.Float(description='Video sources: offset (seconds) where the chunk ends'),
         'content_preview': fields.String(description='Preview of the source content')
     })
     
@@ -30,6 +38,8 @@ def chat_controller(api):
         'query': fields.String(description='Original user query'),
         'chunks_found': fields.Integer(description='Number of relevant chunks found'),
         'gemini_status': fields.String(description='Status of Gemini API call'),
+        'retrieval_skipped': fields.Boolean(description='Answered from the conversation history without a knowledge base search'),
+        'degraded': fields.Boolean(description='Extractive fallback answer (Gemini slow or unavailable); not saved to the conversation'),
         'project_id': fields.String(description='Project ID'),
         'document_ids': fields.List(fields.String, description='Document IDs used for filtering'),
         'video_ids': fields.List(fields.String, description='Video IDs used for filtering'),
@@ -74,6 +84,7 @@ def chat_controller(api):
                 video_ids = data.get('video_ids', [])
                 project_id = data.get('project_id', None)
                 conversation_id = data.get('conversation_id', None)
+                retrieval = data.get('retrieval', None)
                 
                 # Get user_id from JWT token
                 user_id = getattr(request, 'user', {}).get('sub', None)
@@ -84,6 +95,9 @@ def chat_controller(api):
                 if not user_question:
                     return {'error': 'Question is required'}, 400
                 
+                if retrieval and retrieval not in ('auto', 'always', 'never'):
+                    return {'error': "retrieval must be one of: auto, always, never"}, 400
+
                 # Ensure document_ids is a list
                 if document_ids and not isinstance(document_ids, list):
                     document_ids = [document_ids]
@@ -98,7 +112,8 @@ def chat_controller(api):
                     project_id=project_id,
                     document_ids=document_ids,
                     video_ids=video_ids,
-                    conversation_id=conversation_id
+                    conversation_id=conversation_id,
+                    retrieval=retrieval
                 )
                 
                 return response, 200
@@ -163,6 +178,63 @@ def chat_controller(api):
                     'message': str(e)
                 }, 500
 
+    batch_request_model = chat_ns.model('ChatBatchRequest', {
+        'project_id': fields.String(required=True, description='Project whose documents and videos are searched'),
+        'questions': fields.List(fields.String, required=True, description='Questions to answer'),
+        'document_ids': fields.List(fields.String, required=False, description='Override the project document IDs (optional)'),
+        'video_ids': fields.List(fields.String, required=False, description='Override the project video IDs (optional)')
+    })
+
+    @chat_ns.route('/batch')
+    class ChatBatchResource(Resource):
+
+        @chat_ns.expect(batch_request_model)
+        @token_required
+        def post(self):
+            """
+            Answer many questions against one project, streamed as NDJSON
+
+            For evaluation and FAQ-generation jobs. The project is resolved once, all
+            questions are embedded in one batch, vector searches run concurrently and
+            Gemini is called with bounded concurrency. Questions are stateless (no
+            conversation memory, nothing stored). Each line of the response is one
+            result with the index of its question, in completion order.
+            """
+            data = request.get_json()
+            if not data:
+                return {'error': 'Request body is required'}, 400
+
+            questions = data.get('questions') or []
+            project_id = data.get('project_id', None)
+            document_ids = data.get('document_ids', None)
+            video_ids = data.get('video_ids', None)
+
+            if not isinstance(questions, list) or not all(isinstance(question, str) and question.strip() for question in questions):
+                return {'error': 'questions must be a non-empty list of non-empty strings'}, 400
+            if not questions:
+                return {'error': 'questions is required'}, 400
+            if len(questions) > chat_service.batch_max_questions:
+                return {'error': f'At most {chat_service.batch_max_questions} questions per batch'}, 400
+            if not project_id and document_ids is None and video_ids is None:
+                return {'error': 'project_id is required'}, 400
+
+            try:
+                # Project lookup and the batch embedding happen here, so their errors get a status code
+                results = chat_service.process_batch_queries(
+                    questions=[question.strip() for question in questions],
+                    project_id=project_id,
+                    document_ids=document_ids,
+                    video_ids=video_ids
+                )
+            except Exception as e:
+                return {
+                    'error': 'Internal server error',
+                    'message': str(e)
+                }, 500
+
+            lines = (json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+            return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
     @chat_ns.route('/summarize/<string:conversation_id>')
     class ConversationSummaryResource(Resource):
         
@@ -1,7 +1,8 @@
 from flask_restx import Resource, fields, Namespace
 from flask import current_app
 
-from services.document_service import DocumentService
+from config.token_config import internal_secret_required
+from services.chunk_store import ChunkStore
 
 
 def document_controller(api):
@@ -22,6 +23,9 @@ def document_controller(api):
     # @document_ns.marshal_list_with(document_model)
     class DocumentResource(Resource):
         def get(self):
+            # Imported here: the ingestion stack (boto3, extraction backends) isn't needed by the rest of the API
+            from services.document_service import DocumentService
+
             # Create document service instance with current app context
             document_service = DocumentService(current_app)
             documents = document_service.get_all_documents()
@@ -34,6 +38,31 @@ def document_controller(api):
                     'uploaded_at': doc.uploaded_at.isoformat() if doc.uploaded_at else None
                 })
             return result, 200
+
+    @document_ns.route('/chunks/<string:source_type>/<string:source_id>')
+    class ChunkPurgeResource(Resource):
+        @internal_secret_required
+        def delete(self, source_type, source_id):
+            """
+            Purge all indexed chunks of a deleted document or video.
+            source_type: document | video
+            """
+            collections = {
+                'document': ("document_chunks", "document_id"),
+                'video': ("video_chunks", "video_id")
+            }
+            if source_type not in collections:
+                return {'error': f'Unsupported source type: {source_type}'}, 400
+
+            try:
+                collection_name, source_key = collections[source_type]
+                deleted = ChunkStore().delete_source(collection_name, source_key, source_id)
+                return {'source_type': source_type, 'source_id': source_id, 'deleted_chunks': deleted}, 200
+            except Exception as e:
+                return {
+                    'error': 'Internal server error',
+                    'message': str(e)
+                }, 500
     
     return document_ns
 
@@ -0,0 +1,47 @@
+from flask import current_app
+from flask_restx import Resource
+
+from config import readiness
+from services import workload_budget
+
+
+def health_controller(api):
+
+    health_ns = api.namespace('Health',
+                              description='Liveness / readiness probes for the load balancer / orchestrator',
+                              path='/health')
+
+    @health_ns.route('/live')
+    class LivenessResource(Resource):
+        def get(self):
+            """The process is up and serving HTTP (not-live once warm-up has kept failing past the grace period)."""
+            if not readiness.is_live():
+                return {'status': 'warm-up failed', 'uptime_seconds': round(readiness.uptime_seconds(), 1)}, 503
+            return {'status': 'alive', 'uptime_seconds': round(readiness.uptime_seconds(), 1)}, 200
+
+    @health_ns.route('/ready')
+    class ReadinessResource(Resource):
+        def get(self):
+            """Ready to serve chat traffic: vector stores, DB connections and models are warm."""
+            status = readiness.status()
+            return status, 200 if status['status'] == 'ready' else 503
+
+    @health_ns.route('/workloads')
+    class WorkloadMetricsResource(Resource):
+        def get(self):
+            """Thread budgets and latency metrics of query embedding, ingestion embedding and transcription."""
+            return workload_budget.snapshot(), 200
+
+    @health_ns.route('/gemini')
+    class GeminiMetricsResource(Resource):
+        def get(self):
+            """Gemini gateway: in-flight/queued calls, queue wait, retries and rejections."""
+            return current_app.extensions["chat_service"].gemini.stats(), 200
+
+    @health_ns.route('/retrieval')
+    class RetrievalRouterMetricsResource(Resource):
+        def get(self):
+            """Retrieval router: chat turns answered from history without vector search (skip rate)."""
+            return current_app.extensions["chat_service"].retrieval_router.stats(), 200
+
+    return health_ns
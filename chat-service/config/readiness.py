@@ -0,0 +1,133 @@
+"""
+Startup warm-up state of the process, reported by the health endpoints.
+
+Warm-up steps run at startup. With the pre-fork server the master runs the steps
+that don't touch the model and each worker runs the rest after fork. The process
+is ready when every required component warmed successfully.
+Failed required components are retried in the background with exponential
+backoff (READINESS_RETRY_SECONDS doubling up to READINESS_RETRY_MAX_SECONDS);
+if they still fail after READINESS_GRACE_SECONDS the process reports not-live so
+the orchestrator restarts it.
+"""
+import os
+import time
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_components = {}
+_steps = {}
+_lock = threading.Lock()
+_started_at = time.time()
+# Process running the retry thread (a forked worker has to start its own)
+_retry_pid = None
+
+
+def run_component(name, warm_up, required=True):
+    """
+    Run one warm-up step and record its state and duration.
+
+    Returns:
+        bool: True if the step succeeded
+    """
+    with _lock:
+        _steps[name] = warm_up
+        attempts = _components.get(name, {}).get("attempts", 0) + 1
+        _components[name] = {
+            "state": "warming", "required": required, "seconds": None, "error": None, "attempts": attempts
+        }
+
+    started = time.perf_counter()
+    try:
+        warm_up()
+        state, error = "ready", None
+    except Exception as e:
+        state, error = "failed", str(e)
+
+    with _lock:
+        _components[name].update({
+            "state": state,
+            "seconds": round(time.perf_counter() - started, 3),
+            "error": error
+        })
+    return state == "ready"
+
+
+def mark_ready():
+    """Declare warm-up finished; the process is ready if no required component failed."""
+    with _lock:
+        if all(component["state"] == "ready" for component in _components.values() if component["required"]):
+            _ready.set()
+
+
+def retry_failed():
+    """
+    Re-run failed required components in a background thread, with exponential
+    backoff, until they all succeed; then the process becomes ready.
+    """
+    global _retry_pid
+    with _lock:
+        if _ready.is_set() or _retry_pid == os.getpid():
+            return
+        _retry_pid = os.getpid()
+    threading.Thread(target=_retry_loop, name="readiness-retry", daemon=True).start()
+
+
+def _retry_loop():
+    delay = float(os.getenv("READINESS_RETRY_SECONDS", 2))
+    max_delay = float(os.getenv("READINESS_RETRY_MAX_SECONDS", 60))
+    while True:
+        with _lock:
+            failed = [
+                (name, _steps[name], component["error"]) for name, component in _components.items()
+                if component["required"] and component["state"] == "failed"
+            ]
+        if not failed:
+            mark_ready()
+            logger.info(f"Warm-up recovered, ready={is_ready()}")
+            return
+
+        logger.warning(f"Retrying warm-up of {', '.join(name for name, _, _ in failed)} in {delay:.0f}s "
+                       f"(last error: {failed[0][2]})")
+        time.sleep(delay)
+        for name, step, _ in failed:
+            run_component(name, step, required=True)
+        delay = min(max_delay, delay * 2)
+
+
+def after_fork():
+    """Reset process-local state in a forked worker, before it runs its own warm-up steps."""
+    global _lock, _retry_pid
+    # The parent's retry thread may have held the lock at fork time, and isn't running here
+    _lock = threading.Lock()
+    _retry_pid = None
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def is_live():
+    """False once required components have kept failing past READINESS_GRACE_SECONDS."""
+    if is_ready() or uptime_seconds() < float(os.getenv("READINESS_GRACE_SECONDS", 600)):
+        return True
+    return status()["status"] != "failed"
+
+
+def status():
+    with _lock:
+        components = {name: dict(component) for name, component in _components.items()}
+    return {
+        "status": "ready" if is_ready() else (
+            "failed" if any(c["state"] == "failed" and c["required"] for c in components.values()) else "starting"
+        ),
+        "warm_up_seconds": round(sum(c["seconds"] or 0 for c in components.values()), 3),
+        "components": components
+    }
+
+
+def uptime_seconds():
+    return time.time() - _started_at
@@ -0,0 +1,66 @@
+import os
+import sys
+
+
+def gunicorn_options(after_fork=None):
+    """
+    Settings of the production pre-fork server (GUNICORN_*).
+
+    The app is created and its model weights loaded in the master before workers are
+    forked (preload), so they are shared copy-on-write; the model first runs in the
+    workers (post_fork), never in the master. SIGHUP recycles the workers
+    gracefully; each request is bounded by GUNICORN_TIMEOUT.
+    """
+    cpu_count = os.cpu_count() or 1
+    return {
+        "bind": f"0.0.0.0:{os.getenv('API_PORT', 7075)}",
+        "workers": int(os.getenv("GUNICORN_WORKERS", cpu_count)),
+        "worker_class": "gthread",
+        "threads": int(os.getenv("GUNICORN_THREADS", 4)),
+        "timeout": int(os.getenv("GUNICORN_TIMEOUT", 120)),
+        "graceful_timeout": int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30)),
+        "keepalive": int(os.getenv("GUNICORN_KEEPALIVE", 5)),
+        # Recycle workers now and then to bound memory growth
+        "max_requests": int(os.getenv("GUNICORN_MAX_REQUESTS", 1000)),
+        "max_requests_jitter": int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100)),
+        "preload_app": True,
+        "post_fork": lambda server, worker: post_fork(server, worker, after_fork),
+    }
+
+
+def post_fork(server, worker, after_fork=None):
+    """
+    Split the CPU between workers so their torch thread pools don't oversubscribe the
+    cores, then let the app replace state that must not be shared across processes and
+    finish its warm-up. The master never ran the model, so the pools are created here.
+    """
+    if "torch" in sys.modules:
+        import torch
+        from services import workload_budget
+        workers = server.cfg.workers or 1
+        torch.set_num_threads(
+            workload_budget.threads(workload_budget.QUERY_EMBEDDING) or max(1, (os.cpu_count() or 1) // workers)
+        )
+    if after_fork is not None:
+        after_fork()
+
+
+def serve(app, after_fork=None):
+    """
+    Run app on gunicorn with gunicorn_options(); the app object is already loaded in this process.
+
+    Args:
+        app: WSGI app, created (and warmed) before the workers are forked
+        after_fork (callable, optional): Runs in every worker right after fork
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class PreloadedApplication(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(after_fork).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    PreloadedApplication().run()
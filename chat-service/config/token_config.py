@@ -38,6 +38,22 @@ def token_required(f):
         return f(*args, **kwargs)
     return decorated
 
+def internal_secret_required(f):
+    """
+    Protect service-to-service endpoints with the shared X-Internal-Secret header
+    (same secret this service sends to the Project Service).
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        expected = os.getenv("INTERNAL_API_SECRET")
+        provided = request.headers.get('X-Internal-Secret')
+
+        if not expected or provided != expected:
+            return {"message": "Invalid internal secret"}, 403
+
+        return f(*args, **kwargs)
+    return decorated
+
 def build_user_headers(payload: dict) -> dict:
     """
     Build custom headers from JWT payload to propagate user info.
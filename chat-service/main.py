@@ -1,46 +1,257 @@
+import time
+
+# Measured before any heavy import so the startup log covers the whole boot
+_STARTED_AT = time.perf_counter()
+
+import argparse
+import atexit
+import logging
+import multiprocessing
 import threading
 import os
+import signal
 from dotenv import load_dotenv
-from flask import app
-from config.config import create_app
-from services.sqs_listener import SQSListener
-from api.chat_controller import chat_controller
-from api.document_controller import document_controller
 
-def start_listeners():
+
+ROLES = ("all", "api", "document-worker", "video-worker")
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger("main")
+
+
+def _rss_mb():
+    """Current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _log_ready(role):
+    logger.info(f"Role '{role}' ready in {time.perf_counter() - _STARTED_AT:.1f}s, RSS {_rss_mb():.0f} MB")
+
+
+def _create_listener(queue_env):
+    # Imports the document/video pipeline (boto3, extraction, Whisper engine) only in worker roles
+    from services.sqs_listener import SQSListener
+    return SQSListener(queue_url=os.getenv(queue_env))
+
+
+def start_listeners(document=True, video=True):
+    """
+    Returns:
+        tuple: (listeners, threads running their listen loops)
+    """
     load_dotenv()
-    document_queue_url= os.getenv("SQS_DOCUMENT_QUEUE_URL")
-    video_queue_url= os.getenv("SQS_VIDEO_QUEUE_URL")
-    
-    document_listener = SQSListener(queue_url=document_queue_url)
-    video_listener = SQSListener(queue_url=video_queue_url)
-
-    document_thread = threading.Thread(target=document_listener.listen)
-    video_thread = threading.Thread(target=video_listener.listen)
-
-    document_thread.start()
-    video_thread.start()
-    
+
+    listeners = []
+    threads = []
+    if document:
+        document_listener = _create_listener("SQS_DOCUMENT_QUEUE_URL")
+        listeners.append(document_listener)
+        threads.append(threading.Thread(target=document_listener.listen, name="document-listener"))
+    if video:
+        video_listener = _create_listener("SQS_VIDEO_QUEUE_URL")
+        listeners.append(video_listener)
+        threads.append(threading.Thread(target=video_listener.listen, name="video-listener"))
+
+    for thread in threads:
+        thread.start()
+
     print("SQS listeners started in background...")
+    return listeners, threads
 
 
-def main():
-    load_dotenv()
-    
+def _stop_listeners(listeners):
+    for listener in listeners:
+        listener.stop()
+
+
+def _run_until_stopped(listeners, threads):
+    """
+    Wait for the listeners of a listener process. SIGTERM/SIGINT stop them after their
+    current batch, so their listen() loops return and release the embedding pool.
+    """
+    def handle(signum, frame):
+        logger.info(f"Received signal {signum}, stopping listeners")
+        _stop_listeners(listeners)
+
+    signal.signal(signal.SIGTERM, handle)
+    signal.signal(signal.SIGINT, handle)
+    for thread in threads:
+        thread.join()
+
+
+def _run_listeners():
+    """Listener process of the combined role when the API runs on gunicorn."""
+    _run_until_stopped(*start_listeners())
+
+
+def _supervise_listeners():
+    """
+    Run the listener process of the combined role and restart it whenever it exits,
+    so SQS ingestion doesn't stop silently while the API keeps reporting ready.
+    Restarts back off from 1s up to 60s while the process keeps dying quickly.
+    """
+    context = multiprocessing.get_context("spawn")
+    stopping = threading.Event()
+    current = {}
+
+    def supervise():
+        delay = 1
+        while not stopping.is_set():
+            process = context.Process(target=_run_listeners, name="listeners")
+            process.start()
+            current["process"] = process
+            started = time.monotonic()
+            process.join()
+            if stopping.is_set():
+                return
+            if time.monotonic() - started > 60:
+                delay = 1
+            logger.error(f"Listener process exited with code {process.exitcode}, restarting in {delay}s")
+            stopping.wait(delay)
+            delay = min(60, delay * 2)
+
+    def stop():
+        stopping.set()
+        process = current.get("process")
+        if process is not None and process.is_alive():
+            process.terminate()
+            process.join(timeout=30)
+
+    threading.Thread(target=supervise, name="listeners-supervisor", daemon=True).start()
+    # Only the gunicorn master stops it; forked workers inherit this atexit hook
+    master_pid = os.getpid()
+    atexit.register(lambda: os.getpid() == master_pid and stop())
+
+
+def create_api():
+    from config.config import create_app
+    from api.chat_controller import chat_controller
+    from api.document_controller import document_controller
+    from api.health_controller import health_controller
+
     app, api = create_app()
-    
+
     chat_namespace = chat_controller(api)
     api.add_namespace(chat_namespace)
-    
+
     document_name = document_controller(api)
     api.add_namespace(document_name)
-    
-    # api.add_namespace(document_controller(api)) 
-    
-    start_listeners()
+
+    api.add_namespace(health_controller(api))
+
+    # api.add_namespace(document_controller(api))
+    return app
+
+
+def warm_up(app, preload=False):
+    """
+    Build vector stores, open DB connections, run a dummy encode and prefetch hot
+    projects (WARMUP_PROJECT_IDS) before traffic arrives.
+
+    With preload (the gunicorn master, before fork) only the steps that don't run the
+    model are done here; each worker encodes in _after_fork, so torch's thread pools
+    are started in the worker rather than inherited from the master.
+    """
+    chat_service = app.extensions["chat_service"]
+    _run_warm_up(app, chat_service.warm_up_steps(_warm_up_project_ids(), preload=preload), mark_ready=not preload)
+
+
+def _warm_up_project_ids():
+    return [project_id.strip() for project_id in os.getenv("WARMUP_PROJECT_IDS", "").split(",") if project_id.strip()]
+
+
+def _run_warm_up(app, steps, mark_ready=True):
+    from config import readiness
+
+    def in_app_context(step):
+        # Steps are also retried later from a background thread
+        def run():
+            with app.app_context():
+                step()
+        return run
+
+    started = time.perf_counter()
+    for name, step, required in steps:
+        if not readiness.run_component(name, in_app_context(step), required):
+            logger.error(f"Warm-up step '{name}' failed: {readiness.status()['components'][name]['error']}")
+    logger.info(f"Warm-up steps {', '.join(name for name, _, _ in steps)} finished in {time.perf_counter() - started:.2f}s")
+    if not mark_ready:
+        return
+    readiness.mark_ready()
+    logger.info(f"Warm-up finished (ready={readiness.is_ready()})")
+    if not readiness.is_ready():
+        # e.g. the DB was briefly down at boot: keep retrying instead of staying unready forever
+        readiness.retry_failed()
+
+
+def _after_fork(app):
+    from config import readiness
+    readiness.after_fork()
+    chat_service = app.extensions["chat_service"]
+    with app.app_context():
+        chat_service.after_fork()
+    _run_warm_up(app, chat_service.compute_warm_up_steps(_warm_up_project_ids()))
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Chat service")
+    parser.add_argument(
+        "--role",
+        choices=ROLES,
+        default=os.getenv("SERVICE_ROLE", "all"),
+        help="api: HTTP API only; document-worker / video-worker: one SQS ingestion listener; all: everything"
+    )
+    parser.add_argument(
+        "--server",
+        choices=("dev", "gunicorn"),
+        default=os.getenv("API_SERVER", "dev"),
+        help="dev: Flask development server; gunicorn: pre-fork production server (role all runs the listeners in a separate process)"
+    )
+    args = parser.parse_args()
+    role = args.role
+
+    # When the API and the listeners share a process (role all on the dev server), keep
+    # background CPU work out of it. With gunicorn the listeners already have their own
+    # process, and isolating them there would only load more copies of the models.
+    os.environ.setdefault("WORKLOAD_ISOLATION", "true" if role == "all" and args.server == "dev" else "false")
+
+    if role in ("document-worker", "video-worker"):
+        listeners, threads = start_listeners(document=role == "document-worker", video=role == "video-worker")
+        _log_ready(role)
+        _run_until_stopped(listeners, threads)
+        return
+
+    app = create_api()
+    warm_up(app, preload=args.server == "gunicorn")
+    _log_ready(role)
+
+    if args.server == "gunicorn":
+        if role == "all":
+            # Listener threads don't survive gunicorn's fork, so they get their own spawned process
+            _supervise_listeners()
+
+        from config.server_config import serve
+        serve(app, after_fork=lambda: _after_fork(app))
+        return
+
+    listeners = start_listeners()[0] if role == "all" else []
 
     port = int(os.getenv("API_PORT", 7075))
-    app.run(host="0.0.0.0", port=port, debug=True, use_reloader=False)
-    
+    try:
+        app.run(host="0.0.0.0", port=port, debug=os.getenv("FLASK_DEBUG", "false").lower() == "true", use_reloader=False)
+    finally:
+        # The listener threads aren't daemons: stop them so the process can exit
+        _stop_listeners(listeners)
+
 if __name__ == "__main__":
     main()
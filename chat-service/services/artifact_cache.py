@@ -0,0 +1,165 @@
+import os
+import gzip
+import json
+import uuid
+import hashlib
+import logging
+import tempfile
+import threading
+
+
+MB = 1024 * 1024
+
+
+class ArtifactCache:
+    """
+    Content-addressed cache for expensive extraction results (document text,
+    transcript segments) on local disk.
+
+    Entries are keyed by the SHA-256 of the source file plus the extractor version,
+    so a re-upload of the same bytes (or a retry after a failed embedding) skips
+    extraction, while an extractor/model change naturally misses. Entries are
+    gzip-compressed JSON lines; the directory is capped at ARTIFACT_CACHE_MAX_MB and
+    the least recently used entries are evicted first.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or os.getenv("ARTIFACT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "kb-artifacts")
+        self.max_bytes = max_bytes or int(os.getenv("ARTIFACT_CACHE_MAX_MB", 2048)) * MB
+        self.enabled = os.getenv("ARTIFACT_CACHE_ENABLED", "true").lower() == "true"
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.enabled:
+            os.makedirs(self.root, exist_ok=True)
+
+    @classmethod
+    def shared(cls, root=None):
+        """Get the process-wide cache for a directory, so eviction sees every writer."""
+        root = root or os.getenv("ARTIFACT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "kb-artifacts")
+        with cls._shared_lock:
+            if root not in cls._shared:
+                cls._shared[root] = cls(root)
+            return cls._shared[root]
+
+    @staticmethod
+    def file_digest(file_path):
+        """SHA-256 of a file, read in 1 MB blocks."""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as source:
+            for block in iter(lambda: source.read(MB), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _entry_path(self, digest, kind, version):
+        name = hashlib.sha256(f"{kind}:{version}:{digest}".encode("utf-8")).hexdigest()
+        return os.path.join(self.root, f"{kind}-{name}.jsonl.gz")
+
+    def stream(self, file_path, kind, version, produce):
+        """
+        Yield the cached artifact items of a file, or produce them and cache them.
+
+        On a miss, items are passed through to the caller as they are produced and
+        written to the cache at the same time; the entry is only published if the
+        producer runs to completion.
+
+        Args:
+            file_path (str): Local source file (hashed for the cache key)
+            kind (str): Artifact type, e.g. "text" or "transcript"
+            version (str): Extractor identity; change it to invalidate old entries
+            produce (callable): Returns an iterable of JSON-serialisable items
+
+        Yields:
+            Artifact items in their original order
+        """
+        if not self.enabled:
+            yield from produce()
+            return
+
+        digest = self.file_digest(file_path)
+        entry_path = self._entry_path(digest, kind, version)
+
+        items = self._read(entry_path)
+        if items is not None:
+            with self._lock:
+                self.hits += 1
+            self.logger.info(f"Artifact cache hit: {kind} {digest[:12]} ({version})")
+            yield from items
+            return
+
+        with self._lock:
+            self.misses += 1
+
+        temp_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=6) as entry:
+                for item in produce():
+                    entry.write(json.dumps(item) + "\n")
+                    yield item
+            os.replace(temp_path, entry_path)
+            self.logger.info(f"Artifact cached: {kind} {digest[:12]} ({os.path.getsize(entry_path)} bytes)")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        self._evict()
+
+    def _read(self, entry_path):
+        """Load an entry and mark it as recently used; None if missing or unreadable."""
+        try:
+            with gzip.open(entry_path, "rt", encoding="utf-8") as entry:
+                items = [json.loads(line) for line in entry]
+            os.utime(entry_path)
+            return items
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError) as e:
+            self.logger.warning(f"Dropping unreadable cache entry {entry_path}: {e}")
+            self._remove(entry_path)
+            return None
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.root):
+                if not name.endswith(".jsonl.gz"):
+                    continue
+                path = os.path.join(self.root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+
+            evicted = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                evicted += 1
+            self.logger.info(f"Artifact cache: evicted {evicted} entries, {total / MB:.1f} MB kept")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
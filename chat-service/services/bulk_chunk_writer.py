@@ -0,0 +1,109 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+from services.chunk_store import ChunkStore
+
+
+class BulkChunkWriter:
+    """
+    Background writer that coalesces chunk writes from several documents/videos
+    into one COPY-based transaction when they finish around the same time.
+
+    Callers submit a re-index diff and wait on the returned Future; the flusher
+    thread drains whatever is pending (up to max_rows new rows) and writes it in one go.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, connection_string=None, max_rows=None, linger_seconds=None):
+        self.chunk_store = ChunkStore(connection_string)
+        self.max_rows = max_rows or int(os.getenv("CHUNK_WRITER_MAX_ROWS", 20000))
+        # How long to wait for other writes to join a batch before flushing
+        self.linger_seconds = linger_seconds if linger_seconds is not None else float(os.getenv("CHUNK_WRITER_LINGER_SECONDS", 0.2))
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="bulk-chunk-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def shared(cls, connection_string=None):
+        """Get the process-wide writer for a database, so writes from all services can be coalesced."""
+        connection_string = connection_string or os.getenv("DATABASE_URL")
+        with cls._shared_lock:
+            if connection_string not in cls._shared:
+                cls._shared[connection_string] = cls(connection_string)
+            return cls._shared[connection_string]
+
+    def submit(self, collection_name, new_chunks, obsolete_ids, kept_metadata=None):
+        """
+        Queue a re-index diff for writing.
+
+        Returns:
+            Future: Resolves to the inserted/deleted/updated counts once committed
+        """
+        future = Future()
+        diff = {
+            "collection_name": collection_name,
+            "new_chunks": new_chunks,
+            "obsolete_ids": list(obsolete_ids),
+            "kept_metadata": kept_metadata
+        }
+        self._pending.put((diff, future))
+        return future
+
+    def write(self, collection_name, new_chunks, obsolete_ids, kept_metadata=None):
+        """Submit a diff and block until it is committed."""
+        return self.submit(collection_name, new_chunks, obsolete_ids, kept_metadata).result()
+
+    def _run(self):
+        while True:
+            batch = [self._pending.get()]
+            rows = len(batch[0][0]["new_chunks"])
+
+            # Give writes that finish together a moment to join this transaction
+            deadline = time.monotonic() + self.linger_seconds
+            while rows < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += len(item[0]["new_chunks"])
+
+            self._flush(batch, rows)
+
+    def _flush(self, batch, rows):
+        diffs = [diff for diff, _ in batch]
+        start = time.perf_counter()
+        try:
+            results = self.chunk_store.sync_many(diffs)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # One bad diff shouldn't fail the others: fall back to one transaction per diff
+            self.logger.warning(f"Coalesced write of {len(batch)} diffs failed ({e}), retrying individually")
+            for diff, future in batch:
+                try:
+                    future.set_result(self.chunk_store.sync_many([diff])[0])
+                except Exception as single_error:
+                    future.set_exception(single_error)
+            return
+
+        elapsed = time.perf_counter() - start
+        rate = rows / elapsed if elapsed > 0 else float(rows)
+        self.logger.info(f"Bulk wrote {rows} chunk rows for {len(batch)} sources in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
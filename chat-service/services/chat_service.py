@@ -3,16 +3,23 @@ import google.generativeai as genai
 from langchain_postgres import PGVector
 from langchain_core.documents import Document
 import os
+import re
+import time
 from dotenv import load_dotenv
 import json
 import requests
 from flask import request
 from services.embedding_service import SentenceTransformerEmbeddings
+from services import workload_budget
+from services.gemini_gateway import GeminiGateway, GeminiOverloadedError, GeminiUnavailableError
+from services.retrieval_router import RetrievalRouter, HISTORY
 from langchain.memory import ConversationBufferWindowMemory
 from langchain.schema import HumanMessage, AIMessage
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
 import psycopg2
+from sqlalchemy import text
 from psycopg2.extras import RealDictCursor
 from config.config import db
 from repository.entitty.conversation import Conversation
@@ -27,7 +34,11 @@ class ChatService:
         logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
         # Initialize embedding model (same as EmbeddingService for consistency)
-        self.embedding_model = SentenceTransformerEmbeddings("sentence-transformers/all-MiniLM-L6-v2")
+        self.embedding_model = SentenceTransformerEmbeddings(
+            "sentence-transformers/all-MiniLM-L6-v2",
+            threads=workload_budget.threads(workload_budget.QUERY_EMBEDDING),
+            workload=workload_budget.QUERY_EMBEDDING
+        )
         self.logger.info("Embedding model loaded for chat service")
 
         # Initialize vector stores (will be created when needed)
@@ -42,8 +53,25 @@ class ChatService:
 
         genai.configure(api_key=self.gemini_api_key)
         self.gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+        # Concurrency cap, rate limits, bounded queue and retries for every Gemini call
+        self.gemini = GeminiGateway.shared(self.gemini_model)
         self.logger.info("Gemini model initialized")
 
+        # End-to-end budget of a chat query; when generation can't finish in it, an
+        # extractive answer from the retrieved chunks is returned instead
+        self.chat_deadline_seconds = float(os.getenv("CHAT_DEADLINE_SECONDS", 20))
+        # Gemini isn't called at all if less than this is left after retrieval
+        self.min_generation_seconds = float(os.getenv("CHAT_MIN_GENERATION_SECONDS", 2))
+        self.extractive_sentences = int(os.getenv("CHAT_EXTRACTIVE_SENTENCES", 3))
+
+        # Skips retrieval for follow-ups answerable from the history (RETRIEVAL_ROUTER_MODE)
+        self.retrieval_router = RetrievalRouter()
+
+        # Batch question answering (POST /api/chat/batch)
+        self.batch_max_questions = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", 500))
+        self.batch_search_concurrency = int(os.getenv("CHAT_BATCH_SEARCH_CONCURRENCY", 8))
+        self.batch_gemini_concurrency = int(os.getenv("CHAT_BATCH_GEMINI_CONCURRENCY", 4))
+
         # Project Service configuration
         self.project_service_url = os.getenv("PROJECT_SERVICE_URL", "http://localhost:7072/api")
         self.api_secret = os.getenv("INTERNAL_API_SECRET")
@@ -76,6 +104,75 @@ class ChatService:
             )
         return self.video_vectorstore
 
+    def warm_up_steps(self, project_ids=None, preload=False):
+        """
+        Startup warm-up, so the first chat request after a deploy doesn't pay for
+        lazy vector store construction, DB connection setup or the model's first call.
+
+        Args:
+            project_ids (list, optional): Hot projects whose chunk/index pages are prefetched
+            preload (bool): Running in the pre-fork master. The model weights are already
+                loaded (and shared copy-on-write), but nothing is encoded: running the model
+                would start torch's thread pools, which forked workers inherit in a broken
+                state. Workers run compute_warm_up_steps() after fork instead.
+
+        Returns:
+            list: (component name, callable, required) in execution order
+        """
+        steps = [
+            ("vector_stores", lambda: (self._get_document_vectorstore(), self._get_video_vectorstore()), True),
+            ("db_connections", self._open_connections, True),
+        ]
+        if preload:
+            return steps
+        return steps + self.compute_warm_up_steps(project_ids)
+
+    def compute_warm_up_steps(self, project_ids=None):
+        """
+        Warm-up steps that run the embedding model: a dummy encode and one search per
+        hot project. Run in the process that serves the traffic (a worker, after fork).
+
+        Returns:
+            list: (component name, callable, required) in execution order
+        """
+        steps = [("embedding_model", lambda: self.embedding_model.embed_query("warm-up"), True)]
+        if project_ids:
+            steps.append(("hot_projects", lambda: self._prefetch_projects(project_ids), False))
+        return steps
+
+    def _engines(self):
+        """SQLAlchemy engines used while serving chat (PGVector stores and Flask-SQLAlchemy)."""
+        engines = [
+            getattr(store, "_engine", None)
+            for store in (self.document_vectorstore, self.video_vectorstore)
+        ]
+        engines.append(db.engine)
+        return [engine for engine in engines if engine is not None]
+
+    def _open_connections(self):
+        """Fill each connection pool with WARMUP_DB_CONNECTIONS ready connections (needs an app context)."""
+        count = int(os.getenv("WARMUP_DB_CONNECTIONS", 2))
+        for engine in self._engines():
+            connections = [engine.connect() for _ in range(count)]
+            for connection in connections:
+                connection.execute(text("SELECT 1"))
+                connection.close()
+
+    def _prefetch_projects(self, project_ids):
+        """Run one filtered search per hot project so its rows and index pages are cached by Postgres."""
+        for project_id in project_ids:
+            for store in (self._get_document_vectorstore(), self._get_video_vectorstore()):
+                store.similarity_search("warm-up", k=1, filter={"project_id": project_id})
+
+    def after_fork(self):
+        """
+        Drop DB connections inherited from the pre-fork master (sockets can't be shared
+        between processes) and open fresh ones for this worker. Needs an app context.
+        """
+        for engine in self._engines():
+            engine.dispose(close=False)
+        self._open_connections()
+
     def create_conversation(self, project_id=None):
         """
         Create a new conversation session.
@@ -468,7 +565,7 @@ Please provide only the summary without any preamble or additional commentary.""
         try:
             self.logger.info("Requesting conversation summary from Gemini...")
             
-            response = self.gemini_model.generate_content(summary_prompt)
+            response = self.gemini.generate(summary_prompt)
             
             if response.candidates and response.candidates[0].content:
                 summary = response.candidates[0].content.parts[0].text.strip()
@@ -487,6 +584,14 @@ Please provide only the summary without any preamble or additional commentary.""
                     "error": "No summary generated"
                 }
                 
+        except GeminiOverloadedError as e:
+            self.logger.warning(f"Gemini summary shed: {e}")
+            return {
+                "summary": "",
+                "status": "overloaded",
+                "error": str(e)
+            }
+
         except Exception as e:
             self.logger.error(f"Gemini summary error: {str(e)}")
             return {
@@ -682,7 +787,7 @@ Please provide only the summary without any preamble or additional commentary.""
             self.logger.error(f"Error fetching project details: {req_err}")
             raise
 
-    def _search_similar_chunks(self, query, document_ids=None, video_ids=None, limit=5, similarity_threshold=0.2):
+    def _search_similar_chunks(self, query, document_ids=None, video_ids=None, limit=5, similarity_threshold=0.2, embedding=None):
         """
         Search for similar chunks in both document_chunks and video_chunks using LangChain vector stores.
         
@@ -692,6 +797,7 @@ Please provide only the summary without any preamble or additional commentary.""
             video_ids (list, optional): Filter by list of video IDs if available
             limit (int): Maximum number of chunks to return
             similarity_threshold (float): Minimum similarity score (0-1)
+            embedding (list, optional): Precomputed query embedding (e.g. from a batch encode)
             
         Returns:
             list: List of similar chunks (both documents and videos) with content and metadata
@@ -701,6 +807,10 @@ Please provide only the summary without any preamble or additional commentary.""
 
             all_chunks = []
 
+            # Embed once for both collections instead of once per vector store
+            if embedding is None and (document_ids or video_ids):
+                embedding = self.embedding_model.embed_query(query)
+
             # Search document chunks
             if document_ids:
                 self.logger.info(f"Searching document chunks...")
@@ -712,8 +822,8 @@ Please provide only the summary without any preamble or additional commentary.""
                     doc_filter = {"document_id": {"$in": document_ids}}
                 
                 # Perform similarity search
-                doc_results = doc_vectorstore.similarity_search_with_score(
-                    query=query,
+                doc_results = doc_vectorstore.similarity_search_with_score_by_vector(
+                    embedding=embedding,
                     k=limit,
                     filter=doc_filter
                 )
@@ -744,8 +854,8 @@ Please provide only the summary without any preamble or additional commentary.""
                     video_filter = {"video_id": {"$in": video_ids}}
                 
                 # Perform similarity search
-                video_results = video_vectorstore.similarity_search_with_score(
-                    query=query,
+                video_results = video_vectorstore.similarity_search_with_score_by_vector(
+                    embedding=embedding,
                     k=limit,
                     filter=video_filter
                 )
@@ -850,20 +960,31 @@ Please provide only the summary without any preamble or additional commentary.""
 
         return "\n".join(prompt_parts)
 
-    def _chat_with_gemini(self, enhanced_prompt):
+    def _chat_with_gemini(self, enhanced_prompt, deadline=None, hedge=True):
         """
         Send enhanced prompt to Gemini and get response.
         
         Args:
             enhanced_prompt (str): Prompt with context and question
+            deadline (float, optional): time.monotonic() deadline of the request
+            hedge (bool): Allow a hedged request (GEMINI_HEDGE); only for interactive answers
             
         Returns:
             dict: Response with answer and metadata
         """
+        if deadline is not None and deadline - time.monotonic() < self.min_generation_seconds:
+            self.logger.warning("Not enough time left in the request deadline to call Gemini")
+            return {
+                "answer": "",
+                "status": "deadline",
+                "model": "gemini-2.5-flash"
+            }
+
         try:
             self.logger.info("Calling Gemini AI...")
  
-            response = self.gemini_model.generate_content(enhanced_prompt)
+            # Interactive answers may be hedged to cut tail latency (GEMINI_HEDGE)
+            response = self.gemini.generate(enhanced_prompt, deadline=deadline, hedge=hedge)
 
             if response.candidates and response.candidates[0].content:
                 answer = response.candidates[0].content.parts[0].text
@@ -882,6 +1003,24 @@ Please provide only the summary without any preamble or additional commentary.""
                     "model": "gemini-2.5-flash"
                 }
 
+        except GeminiUnavailableError as e:
+            self.logger.warning(f"Gemini unavailable: {e}")
+            return {
+                "answer": "The assistant is temporarily unavailable. Please try again later.",
+                "status": "unavailable",
+                "error": str(e),
+                "model": "gemini-2.5-flash"
+            }
+
+        except GeminiOverloadedError as e:
+            self.logger.warning(f"Gemini call shed: {e}")
+            return {
+                "answer": "The assistant is handling a lot of requests right now. Please try again in a moment.",
+                "status": "deadline" if deadline is not None and time.monotonic() >= deadline else "overloaded",
+                "error": str(e),
+                "model": "gemini-2.5-flash"
+            }
+
         except Exception as e:
             self.logger.error(f"Gemini error: {str(e)}")
             return {
@@ -891,7 +1030,46 @@ Please provide only the summary without any preamble or additional commentary.""
                 "model": "gemini-2.5-flash"
             }
 
-    def process_chat_query(self, user_question, user_id, project_id=None, document_ids=None, video_ids=None, conversation_id=None):
+    def _extractive_answer(self, user_question, chunks):
+        """
+        Build a fallback answer from the retrieved chunks when Gemini can't answer in time.
+
+        Picks the sentences of the top chunks that share the most terms with the
+        question (ties broken by chunk similarity) and keeps them in their original order.
+
+        Args:
+            user_question (str): User's question
+            chunks (list): Retrieved chunks, best first
+
+        Returns:
+            str: Extractive answer
+        """
+        if not chunks:
+            return "I couldn't generate an answer right now and found no relevant information in the knowledge base. Please try again later."
+
+        question_terms = {term for term in re.findall(r"\w+", user_question.lower()) if len(term) > 2}
+        candidates = []
+        for chunk_rank, chunk in enumerate(chunks[:3]):
+            for sentence_rank, sentence in enumerate(re.split(r"(?<=[.!?])\s+", chunk["content"].strip())):
+                sentence = " ".join(sentence.split())
+                if len(sentence) < 20:
+                    continue
+                overlap = len(question_terms & set(re.findall(r"\w+", sentence.lower())))
+                candidates.append((overlap, chunk["similarity"], -sentence_rank, chunk_rank, sentence_rank, sentence))
+
+        best = sorted(candidates, reverse=True)[:self.extractive_sentences]
+        best.sort(key=lambda candidate: (candidate[3], candidate[4]))
+        passages = "\n".join(f"- {candidate[5]}" for candidate in best)
+        if not passages:
+            passages = "\n".join(f"- {chunk['content'].strip()[:300]}" for chunk in chunks[:self.extractive_sentences])
+
+        return (
+            "I can't generate a full answer right now, but these passages from your project look most relevant:\n"
+            f"{passages}"
+        )
+
+    def process_chat_query(self, user_question, user_id, project_id=None, document_ids=None, video_ids=None, conversation_id=None,
+                           retrieval=None):
         """
         Main method to process a chat query with RAG (Retrieval-Augmented Generation) and conversation memory.
         
@@ -902,10 +1080,12 @@ Please provide only the summary without any preamble or additional commentary.""
             document_ids (list, optional): Override document IDs (if not provided, fetched from project)
             video_ids (list, optional): Override video IDs (if not provided, fetched from project)
             conversation_id (str, optional): Conversation ID for maintaining context
+            retrieval (str, optional): Override of the retrieval router mode (auto | always | never)
             
         Returns:
             dict: Complete response with answer, sources, metadata, and conversation_id
         """
+        deadline = time.monotonic() + self.chat_deadline_seconds
         try:
             self.logger.info(f"Chat Query: '{user_question[:100]}...' | Project: {project_id} | Conversation: {conversation_id}")
 
@@ -960,79 +1140,89 @@ Please provide only the summary without any preamble or additional commentary.""
             # Get conversation history for context
             conversation_history = self.get_conversation_history(conversation_id)
 
-            # Fetch project details if document_ids or video_ids not provided
-            if document_ids is None and video_ids is None:
-                self.logger.info(f"Fetching project details for project_id: {project_id}")
-                project_details = self._get_project_details(project_id)
-                document_ids =  project_details.get("document_ids", [])
-                video_ids = project_details.get("video_ids", [])
-            
-            self.logger.info(f"[DEBUG] After project lookup: document_ids={document_ids}, video_ids={video_ids}")
-
-            # Step 1: Search for similar chunks (both documents and videos)
-            similar_chunks = self._search_similar_chunks(
-                query=user_question,
-                document_ids=document_ids,
-                video_ids=video_ids,
-                limit=5,
-                similarity_threshold=0.2
-            )
+            # Follow-ups like "thanks" or "shorten that" only need the history: no
+            # project lookup, query embedding or vector search for them
+            route, route_reason = self.retrieval_router.route(user_question, bool(conversation_history), retrieval)
+            retrieval_skipped = route == HISTORY
 
-            # Step 2: Generate context from chunks
-            context = self._generate_context_from_chunks(similar_chunks)
+            if retrieval_skipped:
+                self.logger.info(f"Retrieval skipped ({route_reason}), answering from conversation history")
+                similar_chunks = []
+                context = "Not retrieved: this message refers to the previous conversation, answer from it."
+            else:
+                # Fetch project details if document_ids or video_ids not provided
+                if document_ids is None and video_ids is None:
+                    self.logger.info(f"Fetching project details for project_id: {project_id}")
+                    project_details = self._get_project_details(project_id)
+                    document_ids =  project_details.get("document_ids", [])
+                    video_ids = project_details.get("video_ids", [])
+
+                self.logger.info(f"[DEBUG] After project lookup: document_ids={document_ids}, video_ids={video_ids}")
+
+                # Step 1: Search for similar chunks (both documents and videos)
+                similar_chunks = self._search_similar_chunks(
+                    query=user_question,
+                    document_ids=document_ids,
+                    video_ids=video_ids,
+                    limit=5,
+                    similarity_threshold=0.2
+                )
+
+                # Step 2: Generate context from chunks
+                context = self._generate_context_from_chunks(similar_chunks)
 
             # Step 3: Create enhanced prompt with conversation history
             enhanced_prompt = self._create_enhanced_prompt(user_question, context, conversation_history)
 
             # Step 4: Get response from Gemini
-            gemini_response = self._chat_with_gemini(enhanced_prompt)
+            gemini_response = self._chat_with_gemini(enhanced_prompt, deadline)
 
-            # Step 5: Save conversation to memory
-            memory.chat_memory.add_user_message(user_question)
-            memory.chat_memory.add_ai_message(gemini_response["answer"])
-            
-            # Update conversation metadata
-            self.conversation_metadata[conversation_id]["message_count"] += 2
+            # Fall back to an extractive answer if Gemini didn't answer (slow, shed, breaker open or failed)
+            degraded = gemini_response["status"] != "success"
+            if degraded:
+                self.logger.warning(f"Returning extractive answer (gemini status: {gemini_response['status']})")
+                gemini_response["answer"] = self._extractive_answer(user_question, similar_chunks)
+
+            # Step 5: Save conversation to memory and the database. Degraded answers
+            # aren't real bot messages, so they're not kept in either.
             self.conversation_metadata[conversation_id]["last_accessed"] = datetime.utcnow()
+            if not degraded:
+                memory.chat_memory.add_user_message(user_question)
+                memory.chat_memory.add_ai_message(gemini_response["answer"])
+                self.conversation_metadata[conversation_id]["message_count"] += 2
+
+                # Step 5.5: Store conversation in database
+                gemini_metadata = {
+                    "model": gemini_response.get("model", "gemini-2.5-flash"),
+                    "status": gemini_response.get("status"),
+                    "chunks_used": len(similar_chunks),
+                    "project_id": project_id
+                }
 
-            # Step 5.5: Store conversation in database
-            gemini_metadata = {
-                "model": gemini_response.get("model", "gemini-2.5-flash"),
-                "status": gemini_response.get("status"),
-                "chunks_used": len(similar_chunks),
-                "project_id": project_id
-            }
-            
-            storage_result = self.store_conversation_to_database(
-                conversation_id=conversation_id,
-                user_id=user_id,
-                user_question=user_question,
-                bot_answer=gemini_response["answer"],
-                project_id=project_id,
-                title=f"{user_question[:50]}..." if len(user_question) > 50 else user_question,
-                gemini_metadata=gemini_metadata
-            )
-            
-            if not storage_result.get('success'):
-                self.logger.warning(f"Failed to store conversation to database: {storage_result.get('error')}")
+                storage_result = self.store_conversation_to_database(
+                    conversation_id=conversation_id,
+                    user_id=user_id,
+                    user_question=user_question,
+                    bot_answer=gemini_response["answer"],
+                    project_id=project_id,
+                    title=f"{user_question[:50]}..." if len(user_question) > 50 else user_question,
+                    gemini_metadata=gemini_metadata
+                )
+
+                if not storage_result.get('success'):
+                    self.logger.warning(f"Failed to store conversation to database: {storage_result.get('error')}")
 
             # Step 6: Prepare final response
             response = {
                 "answer": gemini_response["answer"],
                 "conversation_id": conversation_id,
-                "sources": [
-                    {
-                        "source_id": chunk["source_id"],
-                        "source_type": chunk["source_type"],
-                        "similarity": chunk["similarity"],
-                        "content_preview": chunk["content"][:200] + "..." if len(chunk["content"]) > 200 else chunk["content"]
-                    }
-                    for chunk in similar_chunks
-                ],
+                "sources": self._format_sources(similar_chunks),
                 "metadata": {
                     "query": user_question,
                     "chunks_found": len(similar_chunks),
                     "gemini_status": gemini_response["status"],
+                    "degraded": degraded,
+                    "retrieval_skipped": retrieval_skipped,
                     "project_id": project_id,
                     "document_ids": document_ids,
                     "video_ids": video_ids,
@@ -1055,3 +1245,115 @@ Please provide only the summary without any preamble or additional commentary.""
                     "status": "error"
                 }              
             }               
+
+    def _format_sources(self, chunks):
+        return [
+            {
+                "source_id": chunk["source_id"],
+                "source_type": chunk["source_type"],
+                "similarity": chunk["similarity"],
+                # Seek offsets (seconds) into the video for transcript chunks
+                "timestamp_start": chunk["metadata"].get("timestamp_start"),
+                "timestamp_end": chunk["metadata"].get("timestamp_end"),
+                "content_preview": chunk["content"][:200] + "..." if len(chunk["content"]) > 200 else chunk["content"]
+            }
+            for chunk in chunks
+        ]
+
+    def process_batch_queries(self, questions, project_id=None, document_ids=None, video_ids=None):
+        """
+        Answer many independent questions against one project (evaluation / FAQ jobs).
+
+        The project scope is resolved once, all questions are embedded in one batch,
+        vector searches run concurrently and Gemini calls with bounded concurrency.
+        Questions are stateless: no conversation memory and nothing is stored.
+
+        Args:
+            questions (list): User questions
+            project_id (str): Project ID (used to fetch documents and videos)
+            document_ids (list, optional): Override document IDs
+            video_ids (list, optional): Override video IDs
+
+        Returns:
+            generator: One result dict per question, in completion order, with its index in questions
+
+        Raises:
+            Exception: If the project lookup fails (before anything is streamed)
+        """
+        started = time.perf_counter()
+        if document_ids is None and video_ids is None:
+            project_details = self._get_project_details(project_id)
+            document_ids = project_details.get("document_ids", [])
+            video_ids = project_details.get("video_ids", [])
+
+        embeddings = self.embedding_model.embed_documents_array(questions)
+        self.logger.info(f"Batch of {len(questions)} questions embedded in {time.perf_counter() - started:.2f}s")
+
+        return self._stream_batch_answers(questions, embeddings, document_ids, video_ids, started)
+
+    def _stream_batch_answers(self, questions, embeddings, document_ids, video_ids, started):
+        with ThreadPoolExecutor(max_workers=self.batch_search_concurrency, thread_name_prefix="batch-search") as search_pool, \
+                ThreadPoolExecutor(max_workers=self.batch_gemini_concurrency, thread_name_prefix="batch-answer") as answer_pool:
+            searches = {
+                search_pool.submit(
+                    self._search_similar_chunks, question, document_ids, video_ids, 5, 0.2, embeddings[index].tolist()
+                ): index
+                for index, question in enumerate(questions)
+            }
+            # One wait loop over searches and answers: generation of a question starts as
+            # soon as its search is done, and each answer is streamed as soon as it's ready
+            pending = set(searches)
+            answers = []
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in searches:
+                            index = searches[future]
+                            answer = answer_pool.submit(self._answer_batch_question, index, questions[index], future)
+                            answers.append(answer)
+                            pending.add(answer)
+                        else:
+                            yield future.result()
+            finally:
+                # Client went away: don't search or call Gemini for the questions not started yet
+                for future in list(searches) + answers:
+                    future.cancel()
+
+        self.logger.info(f"Batch of {len(questions)} questions answered in {time.perf_counter() - started:.2f}s")
+
+    def _answer_batch_question(self, index, question, search):
+        try:
+            chunks = search.result()
+            prompt = self._create_enhanced_prompt(question, self._generate_context_from_chunks(chunks))
+            # Offline batch traffic must not spend the hedge budget meant for interactive tail latency
+            gemini_response = self._chat_with_gemini(prompt, time.monotonic() + self.chat_deadline_seconds, hedge=False)
+
+            degraded = gemini_response["status"] != "success"
+            if degraded:
+                gemini_response["answer"] = self._extractive_answer(question, chunks)
+
+            return {
+                "index": index,
+                "question": question,
+                "answer": gemini_response["answer"],
+                "sources": self._format_sources(chunks),
+                "metadata": {
+                    "chunks_found": len(chunks),
+                    "gemini_status": gemini_response["status"],
+                    "degraded": degraded
+                }
+            }
+
+        except Exception as e:
+            self.logger.error(f"Error answering batch question {index}: {str(e)}")
+            return {
+                "index": index,
+                "question": question,
+                "answer": None,
+                "sources": [],
+                "metadata": {
+                    "error": str(e),
+                    "status": "error"
+                }
+            }
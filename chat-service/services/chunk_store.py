@@ -0,0 +1,423 @@
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+
+class ChunkStore:
+    """
+    Direct SQL access to the chunk rows that LangChain PGVector keeps in
+    langchain_pg_embedding / langchain_pg_collection.
+
+    PGVector only knows how to append rows, so re-indexing (diffing, deleting
+    stale chunks, purging a source) is done here against the same tables.
+    """
+
+    EMBEDDING_TABLE = "langchain_pg_embedding"
+    COLLECTION_TABLE = "langchain_pg_collection"
+
+    # Metadata keys chunks are grouped by (one source = one document or video)
+    SOURCE_KEYS = ("document_id", "video_id")
+
+    def __init__(self, connection_string=None):
+        self.connection_string = connection_string or os.getenv("DATABASE_URL")
+        self.logger = logging.getLogger(self.__class__.__name__)
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    def _connect(self):
+        return psycopg2.connect(self.connection_string)
+
+    def _get_collection_id(self, cursor, collection_name):
+        cursor.execute(
+            f"SELECT uuid FROM {self.COLLECTION_TABLE} WHERE name = %s",
+            (collection_name,)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _check_source_key(self, source_key):
+        if source_key not in self.SOURCE_KEYS:
+            raise ValueError(f"Unsupported chunk source key: {source_key}")
+
+    @contextmanager
+    def source_lock(self, collection_name, source_key, source_id):
+        """
+        Serialise re-indexes of one document or video across threads and processes.
+
+        Held from reading the stored chunk ids until the diff is written, so two
+        concurrent re-uploads of the same source can't both plan against the same
+        stored version. It is a session-level advisory lock on its own connection:
+        no transaction stays open and it is released if the process dies.
+        """
+        self._check_source_key(source_key)
+        conn = self._connect()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_lock(hashtext(%s))",
+                    (f"{collection_name}:{source_key}:{source_id}",)
+                )
+            yield
+        finally:
+            # Closing the connection releases the lock
+            conn.close()
+
+    def get_chunk_ids(self, collection_name, source_key, source_id):
+        """
+        Get the ids of all chunks currently stored for one document or video.
+
+        Args:
+            collection_name (str): PGVector collection ("document_chunks" or "video_chunks")
+            source_key (str): Metadata key identifying the source ("document_id" or "video_id")
+            source_id (str): Document or video ID
+
+        Returns:
+            set: Stored chunk ids (empty if the collection does not exist yet)
+        """
+        self._check_source_key(source_key)
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                collection_id = self._get_collection_id(cursor, collection_name)
+                if collection_id is None:
+                    return set()
+
+                cursor.execute(
+                    f"SELECT id FROM {self.EMBEDDING_TABLE} "
+                    f"WHERE collection_id = %s AND cmetadata->>'{source_key}' = %s",
+                    (collection_id, str(source_id))
+                )
+                chunk_ids = {row[0] for row in cursor.fetchall()}
+            conn.commit()
+            return chunk_ids
+        finally:
+            conn.close()
+
+    def sync_chunks(self, collection_name, new_chunks, obsolete_ids, kept_metadata=None):
+        """
+        Apply a re-index diff in a single transaction: insert the new chunks,
+        delete the obsolete ones and refresh metadata of chunks that were kept.
+
+        Args:
+            collection_name (str): PGVector collection name
+            new_chunks (list): Dicts with id, content, embedding and metadata
+            obsolete_ids (iterable): Chunk ids that are no longer part of the source
+            kept_metadata (dict, optional): chunk id -> metadata for unchanged chunks
+
+        Returns:
+            dict: Number of inserted, deleted and updated rows
+        """
+        return self.sync_many([{
+            "collection_name": collection_name,
+            "new_chunks": new_chunks,
+            "obsolete_ids": obsolete_ids,
+            "kept_metadata": kept_metadata
+        }])[0]
+
+    def sync_many(self, diffs):
+        """
+        Apply several re-index diffs (possibly for different documents/videos) in one transaction.
+        New rows of all diffs are streamed into the table with a single COPY.
+
+        Args:
+            diffs (list): Dicts with collection_name, new_chunks, obsolete_ids and kept_metadata
+
+        Returns:
+            list: Per-diff dicts with number of inserted (actually new, ids that already
+                  exist are skipped), deleted and updated rows
+        """
+        results = []
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                collection_ids = {}
+                for diff in diffs:
+                    name = diff["collection_name"]
+                    if name not in collection_ids:
+                        collection_ids[name] = self._get_collection_id(cursor, name)
+                        if collection_ids[name] is None:
+                            raise Exception(f"Vector collection '{name}' does not exist")
+
+                # Deletes and metadata refreshes are per diff
+                for diff in diffs:
+                    collection_id = collection_ids[diff["collection_name"]]
+                    obsolete_ids = list(diff.get("obsolete_ids") or [])
+                    kept_metadata = diff.get("kept_metadata") or {}
+
+                    deleted = 0
+                    if obsolete_ids:
+                        cursor.execute(
+                            f"DELETE FROM {self.EMBEDDING_TABLE} WHERE collection_id = %s AND id = ANY(%s)",
+                            (collection_id, obsolete_ids)
+                        )
+                        deleted = cursor.rowcount
+
+                    self._update_metadata(cursor, kept_metadata)
+
+                    results.append({"inserted": 0, "deleted": deleted, "updated": len(kept_metadata)})
+
+                # Inserts of every diff go through one COPY
+                rows = (
+                    (chunk, collection_ids[diff["collection_name"]])
+                    for diff in diffs
+                    for chunk in (diff.get("new_chunks") or [])
+                )
+                if any(diff.get("new_chunks") for diff in diffs):
+                    inserted_ids = self._copy_chunks(cursor, rows)
+                    for diff, result in zip(diffs, results):
+                        result["inserted"] = sum(1 for chunk in (diff.get("new_chunks") or []) if chunk["id"] in inserted_ids)
+
+            conn.commit()
+            return results
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def open_write_session(self, collection_name):
+        """
+        Start a re-index that accepts chunk rows batch by batch and publishes them
+        atomically at the end. Used when chunks are produced incrementally (streamed
+        extraction), so they don't have to be held in memory until the whole source
+        is processed.
+
+        Returns:
+            ChunkWriteSession
+        """
+        return ChunkWriteSession(self, collection_name)
+
+    def _update_metadata(self, cursor, kept_metadata):
+        if not kept_metadata:
+            return
+        # Chunk ids are globally unique, so no collection filter is needed here
+        execute_values(
+            cursor,
+            f"UPDATE {self.EMBEDDING_TABLE} AS e SET cmetadata = v.cmetadata "
+            f"FROM (VALUES %s) AS v (id, cmetadata) WHERE e.id = v.id",
+            [(chunk_id, json.dumps(metadata)) for chunk_id, metadata in kept_metadata.items()],
+            template="(%s, %s::jsonb)",
+            page_size=1000
+        )
+
+    def _copy_chunks(self, cursor, rows):
+        """
+        Stream chunk rows into a temp staging table with COPY, then move them into
+        the embedding table (COPY itself can't skip ids that already exist).
+
+        Returns:
+            set: Ids of the rows actually inserted
+        """
+        self._stage_rows(cursor, rows)
+        return self._merge_staged(cursor)
+
+    def _stage_rows(self, cursor, rows, on_commit="DROP"):
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS chunk_copy_staging "
+            f"(LIKE {self.EMBEDDING_TABLE} INCLUDING DEFAULTS) ON COMMIT {on_commit}"
+        )
+        cursor.copy_expert(
+            "COPY chunk_copy_staging (id, collection_id, embedding, document, cmetadata) FROM STDIN",
+            _CopyStream(self._copy_lines(rows))
+        )
+
+    def _merge_staged(self, cursor):
+        """
+        Move staged rows into the embedding table, skipping ids that already exist.
+
+        Returns:
+            set: Ids of the rows actually inserted
+        """
+        cursor.execute(
+            f"INSERT INTO {self.EMBEDDING_TABLE} (id, collection_id, embedding, document, cmetadata) "
+            f"SELECT id, collection_id, embedding, document, cmetadata FROM chunk_copy_staging "
+            f"ON CONFLICT (id) DO NOTHING RETURNING id"
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+    def _copy_lines(self, rows):
+        """Render rows in COPY text format, one line at a time."""
+        for chunk, collection_id in rows:
+            fields = (
+                chunk["id"],
+                str(collection_id),
+                self._vector_literal(chunk["embedding"]),
+                chunk["content"],
+                json.dumps(chunk["metadata"])
+            )
+            yield "\t".join(self._copy_escape(field) for field in fields) + "\n"
+
+    @staticmethod
+    def _copy_escape(value):
+        return (
+            str(value)
+            .replace("\x00", "")
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+
+    def delete_source(self, collection_name, source_key, source_id):
+        """
+        Remove every chunk of a deleted document or video.
+
+        Args:
+            collection_name (str): PGVector collection name
+            source_key (str): "document_id" or "video_id"
+            source_id (str): Document or video ID
+
+        Returns:
+            int: Number of chunks removed
+        """
+        self._check_source_key(source_key)
+        conn = self._connect()
+        try:
+            with conn.cursor() as cursor:
+                collection_id = self._get_collection_id(cursor, collection_name)
+                if collection_id is None:
+                    return 0
+
+                cursor.execute(
+                    f"DELETE FROM {self.EMBEDDING_TABLE} "
+                    f"WHERE collection_id = %s AND cmetadata->>'{source_key}' = %s",
+                    (collection_id, str(source_id))
+                )
+                deleted = cursor.rowcount
+            conn.commit()
+            self.logger.info(f"Purged {deleted} chunks for {source_key}={source_id} from {collection_name}")
+            return deleted
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _vector_literal(embedding):
+        """Format an embedding (list or float32 array) as a pgvector text literal."""
+        # 9 significant digits round-trip float32, which is what pgvector stores
+        return "[" + ",".join("%.9g" % value for value in embedding) + "]"
+
+
+class ChunkWriteSession:
+    """
+    One streamed re-index of a source. Batches of new chunks are COPY'd into a
+    staging table of the session's connection as they arrive, in autocommit mode:
+    staging takes no locks on the embedding table and keeps no transaction open
+    while the rest of the source is downloaded, extracted and embedded.
+
+    commit() then publishes everything in one short transaction (move the staged
+    rows, delete obsolete chunks, refresh metadata of kept ones), so readers never
+    see a half-indexed source. Only that transaction holds row locks, and it is
+    capped by CHUNK_PUBLISH_TIMEOUT_SECONDS.
+    """
+
+    def __init__(self, chunk_store, collection_name):
+        self.chunk_store = chunk_store
+        self.collection_name = collection_name
+        self.staged = 0
+        self.stage_seconds = 0.0
+        # Applied at commit, so kept rows aren't locked while the stream runs
+        self.kept_metadata = {}
+        self.publish_timeout = float(os.getenv("CHUNK_PUBLISH_TIMEOUT_SECONDS", 120))
+
+        self.conn = chunk_store._connect()
+        try:
+            self.conn.autocommit = True
+            self.cursor = self.conn.cursor()
+            self.collection_id = chunk_store._get_collection_id(self.cursor, collection_name)
+            if self.collection_id is None:
+                raise Exception(f"Vector collection '{collection_name}' does not exist")
+        except Exception:
+            self.conn.close()
+            raise
+
+    def add(self, new_chunks, kept_metadata=None):
+        """Stage a batch of new chunks and remember the metadata of kept ones."""
+        if new_chunks:
+            start = time.perf_counter()
+            # The staging table lives as long as the connection (each COPY commits on its own)
+            self.chunk_store._stage_rows(
+                self.cursor, ((chunk, self.collection_id) for chunk in new_chunks), on_commit="PRESERVE ROWS"
+            )
+            self.stage_seconds += time.perf_counter() - start
+            self.staged += len(new_chunks)
+        if kept_metadata:
+            self.kept_metadata.update(kept_metadata)
+
+    def commit(self, obsolete_ids):
+        """
+        Publish staged chunks and delete obsolete ones atomically.
+
+        Returns:
+            dict: Number of inserted, deleted and updated rows
+        """
+        try:
+            start = time.perf_counter()
+            self.conn.autocommit = False
+            self.cursor.execute("SET LOCAL statement_timeout = %s", (int(self.publish_timeout * 1000),))
+            obsolete_ids = list(obsolete_ids)
+            deleted = 0
+            if obsolete_ids:
+                self.cursor.execute(
+                    f"DELETE FROM {self.chunk_store.EMBEDDING_TABLE} WHERE collection_id = %s AND id = ANY(%s)",
+                    (self.collection_id, obsolete_ids)
+                )
+                deleted = self.cursor.rowcount
+            self.chunk_store._update_metadata(self.cursor, self.kept_metadata)
+            inserted = len(self.chunk_store._merge_staged(self.cursor)) if self.staged else 0
+            self.conn.commit()
+
+            publish_seconds = time.perf_counter() - start
+            elapsed = self.stage_seconds + publish_seconds
+            self.chunk_store.logger.info(
+                f"Wrote {self.staged} chunk rows to {self.collection_name} in {elapsed:.2f}s "
+                f"({self.staged / elapsed if elapsed > 0 else float(self.staged):.0f} rows/sec, "
+                f"publish transaction {publish_seconds:.2f}s)"
+            )
+            return {"inserted": inserted, "deleted": deleted, "updated": len(self.kept_metadata)}
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.conn.close()
+
+    def rollback(self):
+        """Discard the staged rows (the staging table goes away with the connection)."""
+        if self.conn.closed:
+            return
+        try:
+            if not self.conn.autocommit:
+                self.conn.rollback()
+        finally:
+            self.conn.close()
+
+
+class _CopyStream:
+    """Minimal file-like wrapper so psycopg2's copy_expert can pull COPY data from a generator."""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line.encode("utf-8")
+
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
@@ -1,16 +1,17 @@
 from dotenv import load_dotenv
 import requests
 from repository.entitty.document import Document
-import tempfile
 import logging
 import boto3
 from botocore.exceptions import ClientError
 from repository.entitty.document import Document
 import os
-from PyPDF2 import PdfReader as PdfReader
-from docx import Document as DocxDocument
 import urllib.parse
 from services.embedding_service import EmbeddingService
+from services.s3_downloader import S3Downloader
+from services.artifact_cache import ArtifactCache
+from services.ingestion_pipeline import IngestionPipeline, PipelineStage
+from services import pdf_extraction, docx_extraction
 
 
 class DocumentService:
@@ -25,6 +26,7 @@ class DocumentService:
             aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
             aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")    
         )
+        self.downloader = S3Downloader(self.s3)
         
         self.project_service_url = os.getenv("PROJECT_SERVICE_URL", "http://localhost:7072/api")
         self.api_secret = os.getenv("INTERNAL_API_SECRET")
@@ -34,6 +36,32 @@ class DocumentService:
         self.logger = logging.getLogger(self.__class__.__name__)
         logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
+        # PDF text engine (PDF_BACKEND) and process-pool threshold for large PDFs
+        self.pdf_backend = pdf_extraction.get_backend()
+        self.pdf_parallel_threshold = int(os.getenv("PDF_PARALLEL_PAGE_THRESHOLD", 200))
+        self.logger.info(f"PDF extraction backend: {self.pdf_backend.name}")
+
+        # Extracted text keyed by file hash + extractor version, reused when a file is reprocessed
+        self.artifact_cache = ArtifactCache.shared()
+
+        self.pipeline = self._build_pipeline()
+
+
+    def _build_pipeline(self):
+        """
+        download -> lookup -> index -> status, connected by bounded queues.
+        The index stage streams extraction -> chunking -> embedding -> write per document,
+        so embedding starts before a large PDF is fully parsed.
+        I/O-bound stages get more workers than the CPU-bound ones by default.
+        """
+        workers = IngestionPipeline.stage_workers
+        return IngestionPipeline("document", [
+            PipelineStage("download", self._stage_download, workers("download", 2)),
+            PipelineStage("lookup", self._stage_lookup, workers("lookup", 2)),
+            PipelineStage("index", self._stage_index, workers("index", 1)),
+            PipelineStage("status", self._stage_status, workers("status", 2)),
+        ], meters=self.embedding_service.stream_meters)
+
 
     def get_all_documents(self):
         try:
@@ -104,76 +132,112 @@ class DocumentService:
             event: dict JSON từ message SQS (S3 event)
             """
             try:
-                for record in json.get("Records", []):
-                    s3_info = record.get("s3", {})
-                    bucket = s3_info.get("bucket", {}).get("name")
-                    key = s3_info.get("object", {}).get("key")
-                    self.logger.info(f"Received S3 object: s3://{bucket}/{key}")
-
-                    # # Tải file từ S3 nếu cần
-                    content = self.download_file(bucket, key)
-                    if not content:
-                        continue
-                    
-                    extracted_text = self.extract_text_from_document(key, content)
-                    if extracted_text:
-                        
-                        self.logger.info(f"Extracted text from {key}:\n{extracted_text}")
-                        document = self._call_project_service_get_document(key, "document")
-                        document_id = document.get("documentId")
-                        project_id = document.get("projectId")  # Get project_id from response
-                        
-                        self.chunk_extracted_text(document_id, project_id, extracted_text)
-                        self._update_document_status_after_embedding(document_id, status="COMPLETED")
-                    else:
-                        self.logger.warning(f"No text extracted from document: s3://{bucket}/{key}")
-                    
-
-                    # Lưu thông tin file vào DB (ví dụ)
-                    # self.save_document(bucket, key, content)
+                for future in self.submit_s3_event(json):
+                    future.result()
 
             except Exception as e:
                 self.logger.error(f"Error processing S3 event: {e}")
                 raise
 
-    def download_file(self, bucket, key):
+    def submit_s3_event(self, json):
+        """
+        Queue every S3 record of an event into the ingestion pipeline.
+
+        Returns:
+            list[Future]: One future per record
+        """
+        futures = []
+        for record in json.get("Records", []):
+            s3_info = record.get("s3", {})
+            bucket = s3_info.get("bucket", {}).get("name")
+            key = s3_info.get("object", {}).get("key")
+            self.logger.info(f"Received S3 object: s3://{bucket}/{key}")
+            futures.append(self.pipeline.submit({"bucket": bucket, "key": key}))
+        return futures
+
+    def _stage_download(self, job):
+        bucket, key = job.payload["bucket"], job.payload["key"]
+        if not self._is_supported_document(key):
+            self.logger.warning(f"File {key} is not a supported document type. Skipping.")
+            job.finish()
+            return
+
+        # Stream the file from S3 to a temp dir (removed when the job leaves the pipeline)
         try:
-            decoded_key = urllib.parse.unquote_plus(key)
-            response = self.s3.get_object(Bucket=bucket, Key=decoded_key)
-            content = response["Body"].read()
-            self.logger.info(f"Downloaded file size: {len(content)} bytes")
-            return content
+            job.payload["file_path"] = job.resources.enter_context(self.download_file(bucket, key))
         except ClientError as e:
             self.logger.error(f"Failed to download s3://{bucket}/{key}: {e}")
-            return None
-    
-    
-    def extract_text_from_document(self, key, content):
+            job.finish()
+
+    def _stage_lookup(self, job):
+        document = self._call_project_service_get_document(job.payload["key"], "document")
+        job.payload["document_id"] = document.get("documentId")
+        job.payload["project_id"] = document.get("projectId")  # Get project_id from response
+
+    def _stage_index(self, job):
+        bucket, key = job.payload["bucket"], job.payload["key"]
         self.logger.info(f"Extracting text from document: {key}")
+
+        pieces = self.iter_document_text(key, job.payload["file_path"])
         try:
-            _, ext = os.path.splitext(key)
-            ext = ext.lower()
+            num_chunks = self.embedding_service.index_document_stream(
+                job.payload["document_id"], job.payload["project_id"], pieces
+            )
+        except Exception:
+            # The re-index transaction was rolled back, so the previous version stays searchable
+            self._update_document_status_after_embedding(job.payload["document_id"], status="FAILED")
+            raise
+        # The raw file is no longer needed
+        job.resources.close()
 
-            # Write content to a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
-                tmp_file.write(content)
-                tmp_path = tmp_file.name
+        if not num_chunks:
+            self.logger.warning(f"No text extracted from document: s3://{bucket}/{key}")
+            job.finish()
+
+    def _stage_status(self, job):
+        self._update_document_status_after_embedding(job.payload["document_id"], status="COMPLETED")
+        job.finish(job.payload["document_id"])
+
+    def download_file(self, bucket, key):
+        """
+        Stream a file from S3 to local disk.
 
-            text = ""
+        Returns:
+            contextmanager: Yields the local file path; the file is deleted on exit
+        """
+        return self.downloader.download(bucket, key)
+    
+    
+    def iter_document_text(self, key, file_path):
+        """
+        Lazily extract a document as a stream of text pieces (one per PDF page).
+        Nothing is read until the returned generator is iterated.
+
+        Returns:
+            generator or None: Text pieces, or None if the file type is not supported
+        """
+        _, ext = os.path.splitext(key)
+        ext = ext.lower()
 
-            if ext == ".pdf":
-                text = self._extract_from_pdf(tmp_path)
+        if ext == ".pdf":
+            return self._iter_pdf_pages(file_path)
+        elif ext == ".docx":
+            return self._iter_docx_text(file_path)
+        return None
 
-            elif ext == ".docx":
-                text = self._extract_from_docx(tmp_path)
+    def _is_supported_document(self, key):
+        _, ext = os.path.splitext(key)
+        return ext.lower() in (".pdf", ".docx")
 
-            else:
+    def extract_text_from_document(self, key, file_path):
+        self.logger.info(f"Extracting text from document: {key}")
+        try:
+            pieces = self.iter_document_text(key, file_path)
+            if pieces is None:
                 self.logger.warning(f"File {key} is not a supported document type. Skipping extraction.")
-                os.remove(tmp_path)
                 return None
 
-            # Clean up temp file
-            os.remove(tmp_path)
+            text = "".join(pieces)
 
             self.logger.info(f"Extracted {len(text)} characters from {key}")
             return text.strip() if text else None
@@ -187,89 +251,80 @@ class DocumentService:
         Extract text from PDF, including basic table structure preservation.
         Note: For complex tables, consider using libraries like pdfplumber or camelot-py.
         """
-        text = ""
+        return "".join(self._iter_pdf_pages(file_path))
+
+    def _iter_pdf_pages(self, file_path):
+        """
+        Yield the text of a PDF page by page, each prefixed with its "--- Page N ---" marker.
+        PDFs with at least PDF_PARALLEL_PAGE_THRESHOLD pages are split into page ranges
+        extracted across a process pool, then yielded back in page order.
+        If the configured backend can't open the file, PyPDF2 is used instead.
+        Pages come from the artifact cache when this file was extracted before by the
+        same backend (the cache entry is keyed by the backend that produced it).
+        """
         try:
-            reader = PdfReader(file_path)
-            for page_num, page in enumerate(reader.pages, 1):
-                page_text = page.extract_text()
-                if page_text:
-                    text += f"\n--- Page {page_num} ---\n"
-                    text += page_text + "\n"
-            
-            self.logger.info(f"PDF: Extracted text from {len(reader.pages)} pages")
+            backend, page_count = self._open_pdf(file_path)
+            version = f"pdf:{backend.name}:{pdf_extraction.EXTRACTOR_VERSION}"
+            yield from self.artifact_cache.stream(
+                file_path, "text", version, lambda: self._read_pdf_pages(file_path, backend, page_count)
+            )
         except Exception as e:
             self.logger.error(f"Error extracting from PDF: {e}")
-        
-        return text
+            # Re-raised so a partially extracted document fails the job instead of being indexed truncated
+            raise
 
-    def _extract_from_docx(self, file_path):
+    def _open_pdf(self, file_path):
         """
-        Extract text from DOCX, including paragraphs AND tables with structure preserved.
+        Pick the backend that can open the file: the configured one, else PyPDF2.
+
+        Returns:
+            tuple: (backend, page_count)
         """
-        text = ""
+        backend = self.pdf_backend
         try:
-            doc = DocxDocument(file_path)
-            
-            # Extract in document order (paragraphs and tables interleaved)
-            for element in doc.element.body:
-                # Check if element is a paragraph
-                if element.tag.endswith('p'):
-                    para_text = self._get_paragraph_text(element, doc)
-                    if para_text:
-                        text += para_text + "\n"
-                
-                # Check if element is a table
-                elif element.tag.endswith('tbl'):
-                    table_text = self._extract_table_text(element, doc)
-                    if table_text:
-                        text += "\n" + table_text + "\n"
-            
-            self.logger.info(f"DOCX: Extracted text with tables preserved")
+            return backend, backend.page_count(file_path)
         except Exception as e:
-            self.logger.error(f"Error extracting from DOCX: {e}")
+            if isinstance(backend, pdf_extraction.PyPDF2Backend):
+                raise
+            self.logger.warning(f"PDF backend {backend.name} failed ({e}), falling back to PyPDF2")
+            backend = pdf_extraction.PyPDF2Backend()
+            return backend, backend.page_count(file_path)
+
+    def _read_pdf_pages(self, file_path, backend, page_count):
+        if page_count >= self.pdf_parallel_threshold:
+            self.logger.info(f"PDF: {page_count} pages, extracting in parallel with {backend.name}")
+            pages = pdf_extraction.iter_pages_parallel(backend, file_path, page_count)
+        else:
+            pages = backend.iter_pages(file_path, 0, page_count)
+
+        for page_num, page_text in pages:
+            if page_text:
+                yield f"\n--- Page {page_num} ---\n{page_text}\n"
         
-        return text
+        self.logger.info(f"PDF: Extracted text from {page_count} pages")
 
-    def _get_paragraph_text(self, para_element, doc):
-        """Helper to get text from a paragraph element."""
-        try:
-            from docx.text.paragraph import Paragraph
-            para = Paragraph(para_element, doc)
-            return para.text
-        except:
-            return ""
+    def _extract_from_docx(self, file_path):
+        """
+        Extract text from DOCX, including paragraphs AND tables with structure preserved.
+        """
+        return "".join(self._iter_docx_text(file_path))
 
-    def _extract_table_text(self, table_element, doc):
+    def _iter_docx_text(self, file_path):
         """
-        Extract table content with structure preserved using markdown-style formatting.
+        Yield paragraphs and markdown-style tables in document order, streaming the
+        document XML once instead of building python-docx wrappers per element.
         """
+        version = f"docx:{docx_extraction.EXTRACTOR_VERSION}"
         try:
-            from docx.table import Table
-            table = Table(table_element, doc)
-            
-            table_text = "[TABLE]\n"
-            
-            for i, row in enumerate(table.rows):
-                row_cells = []
-                for cell in row.cells:
-                    cell_text = cell.text.strip().replace("\n", " ")
-                    row_cells.append(cell_text)
-                
-                # Use pipe-separated format for better structure
-                row_text = " | ".join(row_cells)
-                table_text += row_text + "\n"
-                
-                # Add separator after header row (first row)
-                if i == 0 and len(row.cells) > 0:
-                    separator = " | ".join(["---"] * len(row.cells))
-                    table_text += separator + "\n"
-            
-            table_text += "[/TABLE]\n"
-            return table_text
+            yield from self.artifact_cache.stream(
+                file_path, "text", version, lambda: docx_extraction.iter_docx_blocks(file_path)
+            )
             
+            self.logger.info(f"DOCX: Extracted text with tables preserved")
         except Exception as e:
-            self.logger.error(f"Error extracting table: {e}")
-            return ""
+            # Re-raised so a partially extracted document fails the job instead of being indexed truncated
+            self.logger.error(f"Error extracting from DOCX: {e}")
+            raise
 
     def chunk_extracted_text(self, document_id, project_id, text):
         """
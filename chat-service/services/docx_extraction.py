@@ -0,0 +1,145 @@
+"""
+Streaming DOCX text extraction.
+
+Walks word/document.xml once with lxml iterparse and yields body paragraphs and
+tables in document order, with the same text layout python-docx based extraction
+produced (paragraph text per line, tables as "[TABLE] a | b ... [/TABLE]" blocks).
+Top-level elements are cleared as soon as they are emitted, so memory stays flat
+for large table-heavy files.
+"""
+import zipfile
+
+from lxml import etree
+
+
+# Bump when extraction output changes, so cached artifacts of older versions are not reused
+EXTRACTOR_VERSION = "1"
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+
+def _w(tag):
+    return f"{{{W_NS}}}{tag}"
+
+
+W_BODY = _w("body")
+W_P = _w("p")
+W_R = _w("r")
+W_HYPERLINK = _w("hyperlink")
+W_TBL = _w("tbl")
+W_TR = _w("tr")
+W_TC = _w("tc")
+W_TCPR = _w("tcPr")
+W_GRIDSPAN = _w("gridSpan")
+W_VMERGE = _w("vMerge")
+W_VAL = _w("val")
+W_TYPE = _w("type")
+
+# Run children that contribute text, matching python-docx's Run.text
+RUN_TEXT = {
+    _w("t"): lambda el: el.text or "",
+    _w("tab"): lambda el: "\t",
+    _w("ptab"): lambda el: "\t",
+    _w("noBreakHyphen"): lambda el: "-",
+    _w("cr"): lambda el: "\n",
+    _w("br"): lambda el: "\n" if el.get(W_TYPE, "textWrapping") == "textWrapping" else "",
+}
+
+
+def _run_text(run):
+    parts = []
+    for child in run:
+        handler = RUN_TEXT.get(child.tag)
+        if handler:
+            parts.append(handler(child))
+    return "".join(parts)
+
+
+def paragraph_text(paragraph):
+    """Text of a w:p element: its runs and the runs inside hyperlinks."""
+    parts = []
+    for child in paragraph:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag == W_HYPERLINK:
+            parts.extend(_run_text(run) for run in child if run.tag == W_R)
+    return "".join(parts)
+
+
+def _cell_text(cell):
+    text = "\n".join(paragraph_text(p) for p in cell if p.tag == W_P)
+    return text.strip().replace("\n", " ")
+
+
+def _cell_layout(cell):
+    """(grid span, is vertical-merge continuation) of a w:tc element."""
+    span, continuation = 1, False
+    properties = cell.find(W_TCPR)
+    if properties is not None:
+        grid_span = properties.find(W_GRIDSPAN)
+        if grid_span is not None:
+            span = int(grid_span.get(W_VAL, 1))
+        v_merge = properties.find(W_VMERGE)
+        if v_merge is not None:
+            continuation = v_merge.get(W_VAL, "continue") == "continue"
+    return span, continuation
+
+
+def table_text(table):
+    """
+    Render a w:tbl as the markdown-style block used for tables.
+
+    Each physical cell is read once; a horizontally merged cell is repeated for every
+    grid column it spans, and a vertical-merge continuation reuses the text of the
+    cell above, which is the cell list python-docx's Row.cells exposes.
+    """
+    lines = ["[TABLE]"]
+    previous_row = []
+
+    for row_index, row in enumerate(r for r in table if r.tag == W_TR):
+        row_cells = []
+        for cell in (c for c in row if c.tag == W_TC):
+            span, continuation = _cell_layout(cell)
+            if continuation:
+                column = len(row_cells)
+                above = previous_row[column:column + span]
+                row_cells.extend(above + [""] * (span - len(above)))
+            else:
+                row_cells.extend([_cell_text(cell)] * span)
+
+        lines.append(" | ".join(row_cells))
+        # Add separator after header row (first row)
+        if row_index == 0 and row_cells:
+            lines.append(" | ".join(["---"] * len(row_cells)))
+        previous_row = row_cells
+
+    lines.append("[/TABLE]")
+    return "\n".join(lines) + "\n"
+
+
+def iter_docx_blocks(file_path):
+    """
+    Yield the text of body paragraphs and tables in document order.
+
+    Yields:
+        str: "paragraph\\n" or "\\n[TABLE]...[/TABLE]\\n\\n"
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open("word/document.xml") as document_xml:
+            for _, element in etree.iterparse(document_xml, events=("end",), tag=(W_P, W_TBL)):
+                parent = element.getparent()
+                if parent is None or parent.tag != W_BODY:
+                    # Paragraphs inside tables are handled with their table
+                    continue
+
+                if element.tag == W_P:
+                    text = paragraph_text(element)
+                    if text:
+                        yield text + "\n"
+                else:
+                    yield "\n" + table_text(element) + "\n"
+
+                # Drop what has been emitted so the tree doesn't grow with the document
+                element.clear()
+                while element.getprevious() is not None:
+                    del parent[0]
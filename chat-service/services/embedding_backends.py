@@ -0,0 +1,296 @@
+"""
+Sentence embedding inference engines.
+
+EMBED_BACKEND selects how the all-MiniLM-L6-v2 encoder runs:
+- torch: sentence-transformers on PyTorch (reference implementation)
+- onnx: the exported ONNX graph on onnxruntime with a Rust fast tokenizer, optionally
+  int8-quantized (EMBED_ONNX_INT8). It doesn't import torch at all, which keeps
+  startup and resident memory down.
+
+Heavy libraries are imported lazily inside each backend.
+"""
+import os
+import sys
+import time
+import logging
+import multiprocessing
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBackend:
+    """Common interface of embedding engines."""
+
+    name = None
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    @property
+    def identity(self):
+        """Which numerics produce the vectors; stored vectors are only reused under the same identity."""
+        return self.name
+
+    @property
+    def dimension(self):
+        raise NotImplementedError
+
+    def token_lengths(self, texts):
+        """Number of tokens of each text after truncation."""
+        raise NotImplementedError
+
+    def encode(self, texts, batch_size):
+        """
+        Returns:
+            np.ndarray: float32 (len(texts), dimension), L2-normalised like the sentence-transformers pipeline
+        """
+        raise NotImplementedError
+
+
+class TorchBackend(EmbeddingBackend):
+    name = "torch"
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import sentence_transformers  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def __init__(self, model_name, threads=None):
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name)
+
+    @property
+    def dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def token_lengths(self, texts):
+        return [
+            len(ids) for ids in self.model.tokenizer(
+                texts, truncation=True, max_length=self.model.max_seq_length
+            )["input_ids"]
+        ]
+
+    def encode(self, texts, batch_size):
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ).astype(np.float32, copy=False)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    onnxruntime inference of the exported transformer, followed by the same mean
+    pooling and normalisation as the sentence-transformers pipeline.
+
+    The graph is read from EMBED_ONNX_PATH (a directory with model.onnx and
+    tokenizer.json); if unset, the ONNX export published with the model on the
+    Hugging Face hub is downloaded. With EMBED_ONNX_INT8=true the weights are
+    dynamically quantized to int8 once and the quantized graph is reused.
+    """
+
+    name = "onnx"
+    max_seq_length = 256
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import onnxruntime  # noqa: F401
+            import tokenizers  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def __init__(self, model_name, threads=None, model_dir=None, quantize=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if quantize is None:
+            quantize = os.getenv("EMBED_ONNX_INT8", "false").lower() == "true"
+        model_path, tokenizer_path = self._resolve_files(model_name, model_dir or os.getenv("EMBED_ONNX_PATH"))
+        self.quantized = quantize
+        if quantize:
+            model_path = self._quantized(model_path)
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self._dimension = self.session.get_outputs()[0].shape[-1]
+
+        logger.info(f"ONNX embedding model loaded from {model_path}")
+
+    @property
+    def identity(self):
+        return "onnx-int8" if self.quantized else "onnx"
+
+    @staticmethod
+    def _resolve_files(model_name, model_dir):
+        if model_dir:
+            return os.path.join(model_dir, "model.onnx"), os.path.join(model_dir, "tokenizer.json")
+
+        from huggingface_hub import hf_hub_download
+        return hf_hub_download(model_name, "onnx/model.onnx"), hf_hub_download(model_name, "tokenizer.json")
+
+    @staticmethod
+    def _quantized(model_path):
+        quantized_path = model_path[:-len(".onnx")] + "_int8.onnx"
+        if not os.path.exists(quantized_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            # Written under a unique name and renamed atomically, so other processes
+            # (pool / gunicorn workers) never load a half-written graph
+            temp_path = f"{quantized_path[:-len('.onnx')]}.{os.getpid()}.tmp.onnx"
+            try:
+                quantize_dynamic(model_path, temp_path, weight_type=QuantType.QInt8)
+                os.replace(temp_path, quantized_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            logger.info(f"Quantized {model_path} to int8")
+        return quantized_path
+
+    @property
+    def dimension(self):
+        return self._dimension
+
+    def token_lengths(self, texts):
+        return [sum(encoding.attention_mask) for encoding in self.tokenizer.encode_batch(texts)]
+
+    def encode(self, texts, batch_size):
+        output = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+            attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                inputs["token_type_ids"] = np.zeros_like(input_ids)
+            token_embeddings = self.session.run(None, inputs)[0]
+
+            # Mean pooling over real tokens, then L2 normalisation
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            output[start:start + len(encodings)] = pooled / np.clip(
+                np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None
+            )
+        return output
+
+
+BACKENDS = {backend.name: backend for backend in (TorchBackend, OnnxBackend)}
+
+
+def get_backend(model_name, name=None, threads=None):
+    """
+    Create the configured backend (EMBED_BACKEND: torch | onnx).
+    Falls back to torch when onnxruntime isn't installed.
+    """
+    name = (name or os.getenv("EMBED_BACKEND", "torch")).lower()
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown embedding backend: {name}")
+    if not backend.is_available():
+        logger.warning(f"Embedding backend '{name}' is not installed, falling back to torch")
+        backend = TorchBackend
+    return backend(model_name, threads=threads)
+
+
+SAMPLE_TEXTS = [
+    "How do I reset my password?",
+    "The quarterly report shows revenue growth in the APAC region.",
+    "Video transcript: in this lesson we configure the database connection pool.",
+    "Tables: name | role | start date",
+    "Xin chào, tài liệu này mô tả quy trình triển khai.",
+]
+
+
+def parity(model_name, texts=None, backend_name="onnx"):
+    """
+    Cosine agreement between a backend and the torch reference on the same texts.
+
+    Returns:
+        dict: min and mean cosine similarity of corresponding embeddings
+    """
+    texts = texts or SAMPLE_TEXTS
+    reference = TorchBackend(model_name).encode(texts, 32)
+    candidate = get_backend(model_name, backend_name).encode(texts, 32)
+    cosines = (reference * candidate).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    )
+    return {"min": float(cosines.min()), "mean": float(cosines.mean())}
+
+
+def _benchmark_backend(model_name, backend_name, texts, queries):
+    import resource
+    started = time.perf_counter()
+    backend = get_backend(model_name, backend_name)
+    load_seconds = time.perf_counter() - started
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        backend.encode([query], 1)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    start = time.perf_counter()
+    backend.encode(texts, 64)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "load_seconds": load_seconds,
+        "query_p50_ms": latencies[len(latencies) // 2],
+        "query_p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "chunks_per_sec": len(texts) / batch_seconds if batch_seconds else 0.0,
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+
+def benchmark(model_name, backend_names=None, texts=None, query_runs=50):
+    """
+    Query latency, batch throughput and peak RSS per backend. Each backend runs in a
+    fresh process so memory numbers aren't polluted by the other one.
+
+    Returns:
+        dict: backend name -> metrics
+    """
+    backend_names = backend_names or [name for name, backend in BACKENDS.items() if backend.is_available()]
+    texts = texts or SAMPLE_TEXTS * 100
+    queries = (SAMPLE_TEXTS * query_runs)[:query_runs]
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in backend_names:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(_benchmark_backend, (model_name, name, texts, queries))
+    return results
+
+
+if __name__ == "__main__":
+    # python -m services.embedding_backends [model_name]
+    model = sys.argv[1] if len(sys.argv) > 1 else "sentence-transformers/all-MiniLM-L6-v2"
+    if OnnxBackend.is_available() and TorchBackend.is_available():
+        agreement = parity(model)
+        print(f"ONNX vs torch cosine: min={agreement['min']:.5f} mean={agreement['mean']:.5f}")
+    for backend_name, result in benchmark(model).items():
+        print(f"{backend_name:6s} load={result['load_seconds']:.1f}s  query p50={result['query_p50_ms']:.1f}ms "
+              f"p95={result['query_p95_ms']:.1f}ms  {result['chunks_per_sec']:.0f} chunks/sec  "
+              f"peak RSS={result['peak_rss_mb']:.0f} MB")
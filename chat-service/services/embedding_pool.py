@@ -0,0 +1,140 @@
+"""
+Multi-process embedding for bulk ingestion.
+
+Each worker process loads the sentence-transformers model once and is pinned to
+its own torch thread budget, so encoding scales with cores instead of being
+limited by one process. Chunk batches are sharded across workers and gathered
+back in input order.
+"""
+import os
+import math
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from services import workload_budget
+
+
+# Embeddings model held by each pool worker process
+_worker_embeddings = None
+
+
+def _init_worker(model_name, batch_size, threads):
+    """Pool initializer: load the model once per worker with a fixed thread budget."""
+    global _worker_embeddings
+    # Imported here so the parent doesn't pay for it twice and workers load it once
+    from services.embedding_service import SentenceTransformerEmbeddings
+    _worker_embeddings = SentenceTransformerEmbeddings(model_name, batch_size=batch_size, threads=threads)
+
+
+def _embed_shard(texts):
+    return _worker_embeddings.embed_documents_array(texts)
+
+
+class EmbeddingPool:
+    """
+    Process pool that embeds large chunk batches for ingestion/reindex jobs.
+
+    Opt-in with EMBED_POOL_WORKERS > 0. The pool is shared by every service in the
+    process and reference counted: listeners acquire() it when they start and
+    release() it when they stop, and the workers exit with the last user.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, model_name, workers=None, threads_per_worker=None, min_shard_size=None):
+        self.model_name = model_name
+        self.workers = workers if workers is not None else int(os.getenv("EMBED_POOL_WORKERS", 0))
+        if workload_budget.isolated():
+            # Ingestion embedding never runs in the API process
+            self.workers = max(1, self.workers)
+        self.threads_per_worker = threads_per_worker or int(os.getenv(
+            "EMBED_POOL_THREADS_PER_WORKER",
+            workload_budget.threads(workload_budget.INGESTION_EMBEDDING) or max(1, (os.cpu_count() or 1) // max(1, self.workers))
+        ))
+        # Below this many texts per worker, IPC costs more than it saves
+        self.min_shard_size = min_shard_size or int(os.getenv("EMBED_POOL_MIN_SHARD_SIZE", 16))
+        self.batch_size = int(os.getenv("EMBED_BATCH_SIZE", 64))
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+        self._pool = None
+        self._users = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, model_name):
+        """Get the process-wide pool (one set of workers for all services)."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(model_name)
+            return cls._shared
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    @property
+    def running(self):
+        return self._pool is not None
+
+    def acquire(self):
+        """Register a user; starts the worker processes on first use."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._users += 1
+            if self._pool is None:
+                # spawn: forking a process that already runs torch/listener threads is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.batch_size, self.threads_per_worker)
+                )
+                self.logger.info(f"Embedding pool started: {self.workers} workers x {self.threads_per_worker} threads")
+
+    def release(self):
+        """Unregister a user; the last one shuts the workers down."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._users = max(0, self._users - 1)
+            if self._users == 0 and self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+                self.logger.info("Embedding pool stopped")
+
+    def should_use(self, count):
+        """Whether a batch of count texts should go to the pool (always, when workloads are isolated)."""
+        if workload_budget.isolated():
+            return self.running and count > 0
+        return self.running and count >= self.min_shard_size * 2
+
+    def embed(self, texts):
+        """
+        Embed texts across the worker processes.
+
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), dim), in input order
+        """
+        with self._lock:
+            pool = self._pool
+        if pool is None:
+            raise RuntimeError("Embedding pool is not running")
+
+        shard_size = max(self.min_shard_size, math.ceil(len(texts) / self.workers))
+        futures = [
+            pool.submit(_embed_shard, texts[start:start + shard_size])
+            for start in range(0, len(texts), shard_size)
+        ]
+        try:
+            return np.concatenate([future.result() for future in futures])
+        finally:
+            for future in futures:
+                future.cancel()
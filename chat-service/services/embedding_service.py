@@ -1,30 +1,89 @@
 import os
+import uuid
+import time
+import queue
+import hashlib
+import itertools
 import logging
+import contextlib
+import threading
 from datetime import datetime
 
-from sentence_transformers import SentenceTransformer
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_postgres import PGVector
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
+from services.chunk_store import ChunkStore
+from services.bulk_chunk_writer import BulkChunkWriter
+from services.embedding_pool import EmbeddingPool
+from services.ingestion_pipeline import IngestionPipeline, StageMeter
+from services import embedding_backends, workload_budget
 
 
 class SentenceTransformerEmbeddings(Embeddings):
-    """Wrapper to make SentenceTransformer compatible with LangChain's Embeddings interface"""
+    """
+    Wrapper to make SentenceTransformer compatible with LangChain's Embeddings interface.
+    The encoder runs on the backend chosen by EMBED_BACKEND (torch or onnx).
+    """
     
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", batch_size: int = None,
+                 threads: int = None, backend: str = None, workload: str = None):
+        threads = threads or int(os.getenv("EMBED_THREADS", 0))
+        self.backend = embedding_backends.get_backend(model_name, backend, threads=threads)
+        # Model + backend that produce the vectors; part of every chunk id
+        self.model_identity = f"{model_name}@{self.backend.identity}"
+        self.batch_size = batch_size or int(os.getenv("EMBED_BATCH_SIZE", 64))
+        # Workload class whose latency metrics this instance reports (None = untracked)
+        self.workload = workload
+
+        self.logger = logging.getLogger(self.__class__.__name__)
     
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
         """Embed a list of documents"""
-        embeddings = self.model.encode(texts, show_progress_bar=True)
-        return [embedding.tolist() for embedding in embeddings]
+        return self.embed_documents_array(texts).tolist()
+
+    def embed_documents_array(self, texts: list[str]) -> np.ndarray:
+        """
+        Ingestion embedding: texts are sorted by token length and encoded in batches
+        of similar length, so short chunks aren't padded to the longest one in the batch.
+
+        Args:
+            texts (list[str]): Texts to embed
+
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), dim), in input order
+        """
+        if not texts:
+            return np.zeros((0, self.backend.dimension), dtype=np.float32)
+
+        with self._track():
+            return self._encode_sorted(texts)
+
+    def _encode_sorted(self, texts):
+        started = time.perf_counter()
+        order = np.argsort(self.backend.token_lengths(texts), kind="stable")
+
+        embeddings = np.empty((len(texts), self.backend.dimension), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            # Scatter back to the original positions
+            embeddings[batch] = self.backend.encode([texts[i] for i in batch], len(batch))
+
+        elapsed = time.perf_counter() - started
+        self.logger.info(f"Embedded {len(texts)} chunks in {elapsed:.2f}s "
+                         f"({len(texts) / elapsed if elapsed else 0.0:.1f} chunks/sec)")
+        return embeddings
     
     def embed_query(self, text: str) -> list[float]:
         """Embed a single query text"""
-        embedding = self.model.encode([text])
+        with self._track():
+            embedding = self.backend.encode([text], 1)
         return embedding[0].tolist()
 
+    def _track(self):
+        return workload_budget.track(self.workload) if self.workload else contextlib.nullcontext()
+
 
 class EmbeddingService:
     def __init__(self, app=None):
@@ -34,13 +93,35 @@ class EmbeddingService:
         self.app = app  # Store Flask app instance
 
         # Initialize embedding model
-        self.embedding_model = SentenceTransformerEmbeddings("sentence-transformers/all-MiniLM-L6-v2")
-        self.logger.info("Embedding model loaded successfully")
+        model_name = "sentence-transformers/all-MiniLM-L6-v2"
+        # In isolated mode ingestion batches go to the embedding pool, so this in-process copy
+        # must not resize the process-wide torch pool that chat queries use
+        self.embedding_model = SentenceTransformerEmbeddings(
+            model_name,
+            threads=None if workload_budget.isolated() else workload_budget.threads(workload_budget.INGESTION_EMBEDDING),
+            workload=workload_budget.INGESTION_EMBEDDING
+        )
+        self.logger.info(f"Embedding model loaded successfully ({self.embedding_model.backend.name} backend)")
+
+        # Optional worker processes for bulk ingestion (EMBED_POOL_WORKERS); started by the SQS listener
+        self.embedding_pool = EmbeddingPool.shared(model_name)
         
         # Initialize vector stores (will be created when needed)
         self.document_vectorstore = None
         self.video_vectorstore = None
 
+        # Direct access to stored chunks for incremental re-indexing
+        self.chunk_store = ChunkStore(self._get_connection_string())
+        # COPY-based writer shared by every service in the process
+        self.chunk_writer = BulkChunkWriter.shared(self._get_connection_string())
+
+        # Sub-stages of streamed indexing (chunk -> embed -> write), reported by the ingestion pipeline
+        self.stream_meters = (
+            StageMeter("chunk"),
+            StageMeter("embed", IngestionPipeline.stage_workers("embed", 1)),
+            StageMeter("write"),
+        )
+
     def _get_connection_string(self):
         """Get the database connection string from environment"""
         return os.getenv("DATABASE_URL")
@@ -71,6 +152,164 @@ class EmbeddingService:
         return self.video_vectorstore 
 
 
+    def _text_splitter(self, chunk_size=1000, chunk_overlap=200):
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=["\n\n", "\n", ".", "!", "?", " "]
+        )
+
+    def iter_chunks(self, pieces, chunk_size=1000, chunk_overlap=200):
+        """
+        Incrementally split a stream of text pieces (e.g. PDF pages) into chunks.
+
+        Text is buffered only until a few chunks are complete; every chunk but the
+        last one of the buffer is emitted right away, the last one is carried over
+        since it may continue in the next piece.
+
+        Args:
+            pieces (iterable[str]): Text in document order
+            chunk_size (int): Size of each chunk
+            chunk_overlap (int): Overlap between chunks
+
+        Yields:
+            str: Chunk text
+        """
+        splitter = self._text_splitter(chunk_size, chunk_overlap)
+        flush_at = chunk_size * 8
+        buffer = ""
+
+        for piece in pieces:
+            buffer += piece
+            if len(buffer) < flush_at:
+                continue
+
+            chunks = splitter.split_text(buffer)
+            if len(chunks) < 2:
+                continue
+            for chunk_text in chunks[:-1]:
+                yield chunk_text
+
+            tail = chunks[-1]
+            buffer = buffer[buffer.rfind(tail):]
+
+        if buffer.strip():
+            for chunk_text in splitter.split_text(buffer):
+                yield chunk_text
+
+    def iter_segment_chunks(self, segments, chunk_size=1000, chunk_overlap=200):
+        """
+        Group timestamped transcript segments into chunks without splitting a segment.
+
+        Consecutive segments are joined until the chunk would exceed chunk_size; the
+        trailing segments (up to chunk_overlap chars) are repeated at the start of the
+        next chunk. Chunks are emitted as soon as they are complete, so this can consume
+        segments while transcription is still running.
+
+        Args:
+            segments (iterable[dict]): Segments with start, end (seconds) and text
+            chunk_size (int): Target size of each chunk
+            chunk_overlap (int): Overlap between chunks
+
+        Yields:
+            tuple: (chunk text, {"timestamp_start": float, "timestamp_end": float})
+        """
+        def build(window):
+            return " ".join(segment["text"].strip() for segment in window), {
+                "timestamp_start": round(float(window[0]["start"]), 2),
+                "timestamp_end": round(float(window[-1]["end"]), 2)
+            }
+
+        window, length = [], 0
+        for segment in segments:
+            text = segment["text"].strip()
+            if not text:
+                continue
+
+            if window and length + len(text) > chunk_size:
+                yield build(window)
+
+                carried, carried_length = [], 0
+                for previous in reversed(window):
+                    previous_length = len(previous["text"].strip()) + 1
+                    if carried_length + previous_length > chunk_overlap:
+                        break
+                    carried.insert(0, previous)
+                    carried_length += previous_length
+                window, length = carried, carried_length
+
+            window.append(segment)
+            length += len(text) + 1
+
+        if window:
+            yield build(window)
+
+    def split_document_text(self, document_id, text, project_id, chunk_size=1000, chunk_overlap=200):
+        """
+        Split extracted document text into LangChain Documents with chunk metadata.
+        
+        Args:
+            document_id (str): Document ID
+            text (str): Text content to chunk
+            project_id (str): Project ID that contains this document
+            chunk_size (int): Size of each chunk
+            chunk_overlap (int): Overlap between chunks
+            
+        Returns:
+            list[Document]: Chunks in document order
+        """
+        splitter = self._text_splitter(chunk_size, chunk_overlap)
+        chunks = splitter.split_text(text)
+        self.logger.info(f"Document {document_id} split into {len(chunks)} chunks")
+
+        documents = []
+        for idx, chunk_text in enumerate(chunks):
+            
+            metadata = {
+                "document_id": document_id,
+                "video_id": None,  # No video_id for documents
+                "project_id": project_id,
+                "chunk_index": idx,
+                "length": len(chunk_text),
+                "source_type": "document",
+                "created_at": datetime.utcnow().isoformat()
+            }
+            documents.append(Document(page_content=chunk_text.strip(), metadata=metadata))
+        return documents
+
+    def split_video_transcript(self, video_id, transcript, project_id, chunk_size=1000, chunk_overlap=200):
+        """
+        Split a video transcript into LangChain Documents with chunk metadata.
+        
+        Args:
+            video_id (str): Video ID
+            transcript (str): Video transcript text
+            project_id (str): Project ID that contains this video
+            chunk_size (int): Size of each chunk
+            chunk_overlap (int): Overlap between chunks
+            
+        Returns:
+            list[Document]: Chunks in transcript order
+        """
+        splitter = self._text_splitter(chunk_size, chunk_overlap)
+        chunks = splitter.split_text(transcript)
+        self.logger.info(f"Video {video_id} transcript split into {len(chunks)} chunks")
+
+        documents = []
+        for idx, chunk_text in enumerate(chunks):
+            
+            metadata = {
+                "document_id": None,  # No document_id for videos
+                "video_id": video_id,
+                "project_id": project_id,
+                "chunk_index": idx,
+                "length": len(chunk_text),
+                "source_type": "video",
+                "created_at": datetime.utcnow().isoformat()
+            }
+            documents.append(Document(page_content=chunk_text.strip(), metadata=metadata))
+        return documents
+
     def chunk_and_embed(self, document_id, text, project_id, chunk_size=1000, chunk_overlap=200):
         """
         Split text into chunks, generate embeddings, and store them using LangChain PGVector.
@@ -87,38 +326,14 @@ class EmbeddingService:
             raise Exception(f"No text provided for document {document_id}")
 
         try:
-            # Step 1. Split into chunks
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                separators=["\n\n", "\n", ".", "!", "?", " "]
-            )
-            chunks = splitter.split_text(text)
-            self.logger.info(f"Document {document_id} split into {len(chunks)} chunks")
-
-            # Step 2. Create Document objects with metadata
-            documents = []
-            for idx, chunk_text in enumerate(chunks):
-                
-                metadata = {
-                    "document_id": document_id,
-                    "video_id": None,  # No video_id for documents
-                    "project_id": project_id,
-                    "chunk_index": idx,
-                    "length": len(chunk_text),
-                    "source_type": "document",
-                    "created_at": datetime.utcnow().isoformat()
-                }
-                doc = Document(page_content=chunk_text.strip(), metadata=metadata)
-                documents.append(doc)
+            # Step 1. Split into chunks with metadata
+            documents = self.split_document_text(document_id, text, project_id, chunk_size, chunk_overlap)
 
-            # Step 3. Save to vector store using LangChain
-            vectorstore = self._get_document_vectorstore()
-            
-            # Add documents to vector store (this handles embedding and storage)
-            vectorstore.add_documents(documents)
+            # Step 2. Re-index against the chunks already stored for this document
+            stats = self._reindex_source("document_chunks", "document_id", document_id, documents)
             
-            self.logger.info(f"Successfully saved {len(documents)} chunks for document {document_id} in project {project_id}")
+            self.logger.info(f"Successfully indexed {len(documents)} chunks for document {document_id} in project {project_id} "
+                             f"(inserted={stats['inserted']}, deleted={stats['deleted']}, unchanged={stats['updated']})")
             return len(documents)
             
         except Exception as e:
@@ -147,40 +362,361 @@ class EmbeddingService:
             raise Exception(f"No transcript provided for video {video_id}")
 
         try:
-            # Step 1. Split into chunks
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                separators=["\n\n", "\n", ".", "!", "?", " "]
+            # Step 1. Split into chunks with metadata
+            documents = self.split_video_transcript(video_id, transcript, project_id, chunk_size, chunk_overlap)
+
+            # Step 2. Re-index against the chunks already stored for this video
+            stats = self._reindex_source("video_chunks", "video_id", video_id, documents)
+            
+            self.logger.info(f"Successfully indexed {len(documents)} video chunks for video {video_id} in project {project_id} "
+                             f"(inserted={stats['inserted']}, deleted={stats['deleted']}, unchanged={stats['updated']})")
+            return len(documents)
+            
+        except Exception as e:
+            self.logger.error(f"Failed to process video {video_id}: {e}")
+            raise
+
+    def _chunk_id(self, source_key, source_id, content, occurrence):
+        """
+        Build a deterministic chunk id from the chunk content and the embedding
+        model identity, so an unchanged chunk keeps its id (and its embedding)
+        across re-uploads, but is re-embedded when the model or backend changes.
+        """
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        model_identity = self.embedding_model.model_identity
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{model_identity}:{source_key}:{source_id}:{content_hash}:{occurrence}"))
+
+    def plan_reindex(self, collection_name, source_key, source_id, documents):
+        """
+        Diff the new chunk set of a document/video against the chunks already stored.
+
+        Args:
+            collection_name (str): PGVector collection name
+            source_key (str): "document_id" or "video_id"
+            source_id (str): Document or video ID
+            documents (list[Document]): Chunks of the new version, in order
+
+        Returns:
+            dict: Re-index diff; "pending" holds (chunk_id, Document) pairs that still need an embedding
+        """
+        # PGVector creates the collection row on construction
+        if collection_name == "video_chunks":
+            self._get_video_vectorstore()
+        else:
+            self._get_document_vectorstore()
+
+        # Assign ids; identical chunks inside one source are told apart by occurrence
+        occurrences = {}
+        chunk_ids = []
+        for doc in documents:
+            occurrence = occurrences.get(doc.page_content, 0)
+            occurrences[doc.page_content] = occurrence + 1
+            chunk_ids.append(self._chunk_id(source_key, source_id, doc.page_content, occurrence))
+
+        stored_ids = self.chunk_store.get_chunk_ids(collection_name, source_key, source_id)
+
+        return {
+            "collection_name": collection_name,
+            "pending": [(chunk_id, doc) for chunk_id, doc in zip(chunk_ids, documents) if chunk_id not in stored_ids],
+            "new_chunks": [],
+            "kept_metadata": {chunk_id: doc.metadata for chunk_id, doc in zip(chunk_ids, documents) if chunk_id in stored_ids},
+            "obsolete_ids": stored_ids - set(chunk_ids)
+        }
+
+    def embed_diff(self, diff):
+        """Embed the pending chunks of a re-index diff (unchanged chunks keep their stored embedding)."""
+        pending = diff["pending"]
+        embeddings = []
+        if pending:
+            embeddings = self.embed_texts([doc.page_content for _, doc in pending])
+
+        diff["new_chunks"] = [
+            {
+                "id": chunk_id,
+                "content": doc.page_content,
+                "embedding": embedding,
+                "metadata": doc.metadata
+            }
+            for (chunk_id, doc), embedding in zip(pending, embeddings)
+        ]
+        diff["pending"] = []
+        return diff
+
+    def embed_texts(self, texts):
+        """
+        Embed ingestion chunks, sharded across the embedding pool when it is running
+        and the batch is large enough, in-process otherwise.
+
+        Returns:
+            np.ndarray: float32 embeddings in input order
+        """
+        if self.embedding_pool.should_use(len(texts)):
+            with workload_budget.track(workload_budget.INGESTION_EMBEDDING):
+                return self.embedding_pool.embed(texts)
+        return self.embedding_model.embed_documents_array(texts)
+
+    def write_diff(self, diff):
+        """Insert new chunks and delete obsolete ones in one transaction."""
+        return self.chunk_writer.write(
+            diff["collection_name"], diff["new_chunks"], diff["obsolete_ids"], diff["kept_metadata"]
+        )
+
+    def _reindex_source(self, collection_name, source_key, source_id, documents):
+        """
+        Diff the new chunk set of a document/video against the stored chunks,
+        embed only the chunks that are new and apply inserts + deletes in one transaction.
+
+        Returns:
+            dict: Number of inserted, deleted and unchanged chunks
+        """
+        # Planned and written under the source lock, so concurrent re-uploads don't diff against a stale version
+        with self.chunk_store.source_lock(collection_name, source_key, source_id):
+            diff = self.plan_reindex(collection_name, source_key, source_id, documents)
+            self.embed_diff(diff)
+            return self.write_diff(diff)
+
+    def index_document_stream(self, document_id, project_id, pieces, batch_size=None, chunk_size=1000, chunk_overlap=200):
+        """
+        Re-index a document from a stream of extracted text (e.g. one piece per PDF page).
+
+        Extraction + chunking run in a producer thread and hand batches of chunks over
+        a bounded queue, so embedding of the first batches starts while later pages are
+        still being parsed. Each embedded batch is COPY'd into a staging table and the
+        new version is published atomically at the end, so memory depends on the batch
+        size rather than the document size.
+
+        Args:
+            document_id (str): Document ID
+            project_id (str): Project ID that contains this document
+            pieces (iterable[str]): Extracted text in document order
+            batch_size (int, optional): Chunks per embedding batch
+            chunk_size (int): Size of each chunk
+            chunk_overlap (int): Overlap between chunks
+
+        Returns:
+            int: Number of chunks in the new version of the document
+        """
+        chunks = ((chunk_text, {}) for chunk_text in self.iter_chunks(pieces, chunk_size, chunk_overlap))
+        return self._index_stream("document_chunks", "document_id", document_id, project_id, chunks, batch_size)
+
+    def index_video_stream(self, video_id, project_id, segments, batch_size=None, chunk_size=1000, chunk_overlap=200):
+        """
+        Re-index a video from a stream of transcript segments.
+
+        Chunks follow segment boundaries and carry timestamp_start/timestamp_end, so
+        chat sources can seek into the video. Unlike documents, every embedded batch
+        is published right away (chunks become searchable while the rest of the video
+        is still being transcribed); obsolete chunks of the previous version are
+        removed once the stream completes.
+
+        Args:
+            video_id (str): Video ID
+            project_id (str): Project ID that contains this video
+            segments (iterable[dict]): Transcript segments (start, end, text) in timeline order
+            batch_size (int, optional): Chunks per embedding batch
+            chunk_size (int): Size of each chunk
+            chunk_overlap (int): Overlap between chunks
+
+        Returns:
+            int: Number of chunks in the new version of the video
+        """
+        chunks = self.iter_segment_chunks(segments, chunk_size, chunk_overlap)
+        return self._index_stream("video_chunks", "video_id", video_id, project_id, chunks, batch_size, incremental=True)
+
+    def _index_stream(self, collection_name, source_key, source_id, project_id, chunks, batch_size=None, incremental=False):
+        """
+        Index a stream under the source lock: a concurrent re-upload of the same source
+        waits until this one is written, instead of diffing against the same stored version.
+        """
+        with self.chunk_store.source_lock(collection_name, source_key, source_id):
+            return self._index_stream_locked(
+                collection_name, source_key, source_id, project_id, chunks, batch_size, incremental
             )
-            chunks = splitter.split_text(transcript)
-            self.logger.info(f"Video {video_id} transcript split into {len(chunks)} chunks")
 
-            # Step 2. Create Document objects with metadata
-            documents = []
-            for idx, chunk_text in enumerate(chunks):
-                
+    def _index_stream_locked(self, collection_name, source_key, source_id, project_id, chunks, batch_size=None, incremental=False):
+        """
+        Embed and store a stream of (chunk text, extra metadata) for one document or video.
+
+        Runs as three sub-stages connected by bounded queues, each metered for the
+        pipeline report:
+        - chunk: extraction + chunking + chunk ids, in a producer thread
+        - embed: embeds new chunks, PIPELINE_EMBED_WORKERS threads (CPU-bound)
+        - write: COPY into the database, in the calling thread (I/O-bound)
+        With incremental=False, batches are staged in a ChunkWriteSession and published
+        in one short transaction at the end (no transaction or row locks are held while
+        the source streams; being atomic per source, these writes aren't coalesced with
+        other sources by the BulkChunkWriter); with incremental=True, each batch is written as soon as it is embedded
+        and, if the stream fails, the chunks inserted by this run are deleted again so
+        only the previous version remains.
+
+        Returns:
+            int: Number of chunks in the new version of the source
+        """
+        batch_size = batch_size or int(os.getenv("INGEST_EMBED_BATCH_SIZE", 64))
+        source_type = "video" if source_key == "video_id" else "document"
+        started = time.perf_counter()
+
+        # PGVector creates the collection row on construction
+        if collection_name == "video_chunks":
+            self._get_video_vectorstore()
+        else:
+            self._get_document_vectorstore()
+        stored_ids = self.chunk_store.get_chunk_ids(collection_name, source_key, source_id)
+
+        chunk_meter, embed_meter, write_meter = self.stream_meters
+        to_embed = queue.Queue(maxsize=2)
+        to_write = queue.Queue(maxsize=2)
+        done = object()
+        stop = threading.Event()
+        progress = {"chunks": 0, "seen_ids": set()}
+
+        def put(target, item, meter=None):
+            # Gives up when the consumer has stopped, so no thread stays blocked
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    if meter is not None:
+                        meter.queued(1)
+                    return
+                except queue.Full:
+                    pass
+
+        def prepare():
+            occurrences = {}
+            for chunk_text, extra_metadata in chunks:
+                content = chunk_text.strip()
                 metadata = {
-                    "document_id": None,  # No document_id for videos
-                    "video_id": video_id,
+                    "document_id": source_id if source_type == "document" else None,
+                    "video_id": source_id if source_type == "video" else None,
                     "project_id": project_id,
-                    "chunk_index": idx,
+                    "chunk_index": progress["chunks"],
                     "length": len(chunk_text),
-                    "source_type": "video",
-                    "created_at": datetime.utcnow().isoformat()
+                    "source_type": source_type,
+                    "created_at": datetime.utcnow().isoformat(),
+                    **extra_metadata
                 }
-                doc = Document(page_content=chunk_text.strip(), metadata=metadata)
-                documents.append(doc)
+                progress["chunks"] += 1
+
+                occurrence = occurrences.get(content, 0)
+                occurrences[content] = occurrence + 1
+                chunk_id = self._chunk_id(source_key, source_id, content, occurrence)
+                progress["seen_ids"].add(chunk_id)
+                yield chunk_id, content, metadata
+
+        def chunk_stage():
+            try:
+                prepared = prepare()
+                while not stop.is_set():
+                    with chunk_meter.measure():
+                        batch = list(itertools.islice(prepared, batch_size))
+                    if not batch:
+                        break
+                    put(to_embed, batch, embed_meter)
+            except Exception as e:
+                put(to_embed, e, embed_meter)
+            # One end marker per embed worker
+            for _ in range(embed_meter.workers):
+                put(to_embed, done, embed_meter)
+
+        def embed_stage():
+            while not stop.is_set():
+                try:
+                    batch = to_embed.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                embed_meter.queued(-1)
+                if batch is done or isinstance(batch, Exception):
+                    put(to_write, batch, write_meter)
+                    return
+                try:
+                    with embed_meter.measure():
+                        pending, kept_metadata = [], {}
+                        for chunk_id, content, metadata in batch:
+                            if chunk_id in stored_ids:
+                                kept_metadata[chunk_id] = metadata
+                            else:
+                                pending.append((chunk_id, Document(page_content=content, metadata=metadata)))
+                        diff = self.embed_diff({"pending": pending})
+                    put(to_write, (diff["new_chunks"], kept_metadata, len(batch)), write_meter)
+                except Exception as e:
+                    put(to_write, e, write_meter)
+                    return
+
+        threads = [threading.Thread(target=chunk_stage, name=f"chunk-{source_id}", daemon=True)]
+        threads += [
+            threading.Thread(target=embed_stage, name=f"embed-{source_id}-{worker}", daemon=True)
+            for worker in range(embed_meter.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        session = None if incremental else self.chunk_store.open_write_session(collection_name)
+        totals = {"inserted": 0, "deleted": 0, "updated": 0}
+        # Chunks inserted by this run in incremental mode (removed again on failure)
+        inserted_ids = set()
+        try:
+            written = 0
+            finished_workers = 0
+            while finished_workers < embed_meter.workers:
+                item = to_write.get()
+                write_meter.queued(-1)
+                if item is done:
+                    finished_workers += 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+
+                new_chunks, kept_metadata, count = item
+                with write_meter.measure():
+                    if session is not None:
+                        session.add(new_chunks, kept_metadata)
+                    else:
+                        inserted_ids.update(chunk["id"] for chunk in new_chunks)
+                        stats = self.chunk_writer.write(collection_name, new_chunks, [], kept_metadata)
+                        totals["inserted"] += stats["inserted"]
+                        totals["updated"] += stats["updated"]
+                if session is None and written == 0:
+                    self.logger.info(f"First {count} chunks of {source_type} {source_id} searchable "
+                                     f"after {time.perf_counter() - started:.1f}s")
+                written += count
+
+            chunk_count = progress["chunks"]
+            seen_ids = progress["seen_ids"]
+            if chunk_count == 0:
+                if session is not None:
+                    session.rollback()
+                self.logger.warning(f"No chunks produced for {source_type} {source_id}")
+                return 0
+
+            if session is not None:
+                totals = session.commit(stored_ids - seen_ids)
+            elif stored_ids - seen_ids:
+                totals["deleted"] = self.chunk_writer.write(collection_name, [], stored_ids - seen_ids)["deleted"]
+
+            self.logger.info(f"Successfully indexed {chunk_count} chunks for {source_type} {source_id} in project {project_id} "
+                             f"in {time.perf_counter() - started:.1f}s "
+                             f"(inserted={totals['inserted']}, deleted={totals['deleted']}, unchanged={totals['updated']})")
+            return chunk_count
 
-            # Step 3. Save to vector store using LangChain
-            vectorstore = self._get_video_vectorstore()
-            
-            # Add documents to vector store (this handles embedding and storage)
-            vectorstore.add_documents(documents)
-            
-            self.logger.info(f"Successfully saved {len(documents)} video chunks for video {video_id} in project {project_id}")
-            return len(documents)
-            
         except Exception as e:
-            self.logger.error(f"Failed to process video {video_id}: {e}")
-            raise
\ No newline at end of file
+            if session is not None:
+                session.rollback()
+            self.logger.error(f"Failed to process {source_type} {source_id}: {e}")
+            if inserted_ids:
+                self._discard_partial_chunks(collection_name, source_type, source_id, inserted_ids)
+            raise
+        finally:
+            # Unblock and stop the chunk/embed threads if we stopped consuming early
+            stop.set()
+            for thread in threads:
+                thread.join()
+            embed_meter.queued(-to_embed.qsize())
+            write_meter.queued(-to_write.qsize())
+
+    def _discard_partial_chunks(self, collection_name, source_type, source_id, chunk_ids):
+        """Delete the chunks an incremental run inserted before it failed; old chunks are untouched."""
+        try:
+            deleted = self.chunk_writer.write(collection_name, [], chunk_ids)["deleted"]
+            self.logger.info(f"Removed {deleted} partially indexed chunks of {source_type} {source_id}")
+        except Exception as e:
+            self.logger.error(f"Failed to remove partially indexed chunks of {source_type} {source_id}: {e}")
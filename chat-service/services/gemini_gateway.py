@@ -0,0 +1,400 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from google.api_core import exceptions as google_exceptions
+
+
+# Provider errors worth retrying: rate limiting (429) and transient server errors (5xx)
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+class GeminiOverloadedError(Exception):
+    """The call was shed by the gateway (wait queue full or deadline reached before a slot/retry)."""
+
+
+class GeminiUnavailableError(GeminiOverloadedError):
+    """The circuit breaker is open: Gemini failed repeatedly and isn't called until the cooldown ends."""
+
+
+class _AttemptCancelled(Exception):
+    """A hedged attempt stopped because the other attempt already answered."""
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most one
+    minute's worth of tokens.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount, deadline):
+        """
+        Take amount tokens, waiting for the refill if needed.
+
+        Returns:
+            bool: False if the tokens wouldn't be available before deadline
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                wait = (amount - self.tokens) / self.rate
+
+            if now + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    def refund(self, amount):
+        """Give back tokens taken for a request that was never sent."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+
+class GeminiGateway:
+    """
+    Single entry point for Gemini calls of this process.
+
+    - at most GEMINI_MAX_CONCURRENCY calls in flight; up to GEMINI_MAX_QUEUE more wait
+      for a slot, everything beyond that is rejected immediately
+    - request and token rate limits (GEMINI_RPM / GEMINI_TPM token buckets)
+    - every call has a deadline (GEMINI_DEADLINE_SECONDS); waiting, backoff and the
+      request itself all count against it
+    - 429/5xx responses are retried with exponential backoff and full jitter
+    - optional hedging (GEMINI_HEDGE): if a call is still running after the
+      GEMINI_HEDGE_PERCENTILE latency of recent calls, an identical second request is
+      sent and the first response wins. Hedges only use spare slots and rate budget,
+      and are capped at GEMINI_HEDGE_BUDGET of all requests.
+    - circuit breaker: after GEMINI_BREAKER_FAILURES consecutive provider failures
+      (429, 5xx and timeouts; other 4xx are the caller's fault and don't count), calls
+      fail fast for GEMINI_BREAKER_COOLDOWN_SECONDS. Then the breaker is half-open: a
+      single call probes the provider while the others keep failing fast; the breaker
+      closes if the probe succeeds and reopens for another cooldown if it fails.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, model, max_concurrency=None, max_queue=None, deadline_seconds=None, max_retries=None):
+        self.model = model
+        self.max_concurrency = max_concurrency or int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("GEMINI_MAX_QUEUE", 32))
+        self.deadline_seconds = deadline_seconds or float(os.getenv("GEMINI_DEADLINE_SECONDS", 60))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("GEMINI_MAX_RETRIES", 3))
+        self.base_backoff = float(os.getenv("GEMINI_BACKOFF_SECONDS", 0.5))
+        self.max_backoff = float(os.getenv("GEMINI_MAX_BACKOFF_SECONDS", 8))
+
+        self.request_bucket = TokenBucket(float(os.getenv("GEMINI_RPM", 60)))
+        self.token_bucket = TokenBucket(float(os.getenv("GEMINI_TPM", 1000000)))
+        # Output tokens reserved per call on top of the prompt estimate
+        self.expected_output_tokens = int(os.getenv("GEMINI_EXPECTED_OUTPUT_TOKENS", 1024))
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0, "succeeded": 0, "failed": 0, "retries": 0,
+            "rejected_queue_full": 0, "rejected_deadline": 0,
+            "queued": 0, "in_flight": 0
+        }
+        self._queue_waits = deque(maxlen=1000)
+
+        self.hedge_enabled = os.getenv("GEMINI_HEDGE", "false").lower() == "true"
+        self.hedge_percentile = float(os.getenv("GEMINI_HEDGE_PERCENTILE", 95))
+        # Hedge delay until enough latencies have been observed for the percentile
+        self.hedge_default_delay = float(os.getenv("GEMINI_HEDGE_DELAY_SECONDS", 5))
+        self.hedge_budget = float(os.getenv("GEMINI_HEDGE_BUDGET", 0.05))
+        self._stats.update({"hedged": 0, "hedge_wins": 0})
+        self._latencies = deque(maxlen=500)
+        self._executor = None
+
+        self.breaker_failures = int(os.getenv("GEMINI_BREAKER_FAILURES", 5))
+        self.breaker_cooldown = float(os.getenv("GEMINI_BREAKER_COOLDOWN_SECONDS", 30))
+        self._stats.update({"rejected_breaker": 0})
+        self._consecutive_failures = 0
+        # 0 while closed; open until this time.monotonic(), then half-open
+        self._breaker_open_until = 0.0
+        # A half-open probe call is running
+        self._probing = False
+
+    @classmethod
+    def shared(cls, model):
+        """Get the process-wide gateway, so every caller shares one concurrency and rate budget."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(model)
+            return cls._shared
+
+    def generate(self, prompt, deadline=None, hedge=False):
+        """
+        Call generate_content through the gateway.
+
+        Args:
+            prompt (str): Prompt text
+            deadline (float, optional): time.monotonic() deadline; defaults to now + GEMINI_DEADLINE_SECONDS
+            hedge (bool): Allow a hedged second request for this call (when GEMINI_HEDGE is on)
+
+        Returns:
+            GenerateContentResponse
+
+        Raises:
+            GeminiOverloadedError: If the call was shed before reaching Gemini
+            Exception: The provider error, once retries are exhausted or it isn't retryable
+        """
+        deadline = deadline or time.monotonic() + self.deadline_seconds
+
+        with self._lock:
+            self._stats["requests"] += 1
+            probe = False
+            if self._breaker_open_until:
+                if time.monotonic() < self._breaker_open_until or self._probing:
+                    self._stats["rejected_breaker"] += 1
+                    raise GeminiUnavailableError("Gemini circuit breaker is open")
+                self._probing = probe = True
+            if self._stats["queued"] >= self.max_queue:
+                if probe:
+                    self._probing = False
+                self._stats["rejected_queue_full"] += 1
+                raise GeminiOverloadedError("Gemini wait queue is full")
+            self._stats["queued"] += 1
+
+        try:
+            return self._call_admitted(prompt, deadline, hedge)
+        finally:
+            if probe:
+                # A probe that was shed or hit a non-retryable error leaves the breaker half-open
+                with self._lock:
+                    self._probing = False
+
+    def _call_admitted(self, prompt, deadline, hedge):
+        """Wait for a slot, make the call and update the counters and the breaker."""
+        queued_at = time.monotonic()
+        acquired = self._slots.acquire(timeout=max(0.0, deadline - queued_at))
+        with self._lock:
+            self._stats["queued"] -= 1
+            if not acquired:
+                self._stats["rejected_deadline"] += 1
+            else:
+                self._stats["in_flight"] += 1
+                self._queue_waits.append(time.monotonic() - queued_at)
+        if not acquired:
+            raise GeminiOverloadedError("Timed out waiting for a Gemini slot")
+
+        # A hedged call hands its slot to the attempt task, which keeps it until its request returns
+        hedged = hedge and self.hedge_enabled
+        try:
+            started = time.monotonic()
+            if hedged:
+                response = self._call_hedged(prompt, deadline)
+            else:
+                response = self._call_with_retries(prompt, deadline)
+            with self._lock:
+                self._stats["succeeded"] += 1
+                self._latencies.append(time.monotonic() - started)
+                self._consecutive_failures = 0
+                self._breaker_open_until = 0.0
+            return response
+        except GeminiOverloadedError:
+            with self._lock:
+                self._stats["rejected_deadline"] += 1
+            raise
+        except RETRYABLE_ERRORS:
+            with self._lock:
+                self._stats["failed"] += 1
+                self._consecutive_failures += 1
+                if self._consecutive_failures >= self.breaker_failures:
+                    self._breaker_open_until = time.monotonic() + self.breaker_cooldown
+                    self.logger.error(
+                        f"Gemini failed {self._consecutive_failures} times in a row, "
+                        f"circuit breaker open for {self.breaker_cooldown:.0f}s"
+                    )
+            raise
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+            raise
+        finally:
+            if not hedged:
+                self._release_slot()
+
+    def _release_slot(self):
+        with self._lock:
+            self._stats["in_flight"] -= 1
+        self._slots.release()
+
+    def _estimated_tokens(self, prompt):
+        # Rough estimate (~4 chars per token) so the token bucket doesn't need an extra API call
+        return len(prompt) // 4 + self.expected_output_tokens
+
+    def _call_with_retries(self, prompt, deadline, cancelled=None, prepaid=False):
+        """
+        Args:
+            cancelled (threading.Event, optional): Stop before the next attempt or backoff once set
+            prepaid (bool): Rate limit tokens of the first attempt were already taken
+        """
+        estimated_tokens = self._estimated_tokens(prompt)
+
+        attempt = 0
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                raise _AttemptCancelled()
+            if not (prepaid and attempt == 0) and (
+                not self.request_bucket.acquire(1, deadline) or not self.token_bucket.acquire(estimated_tokens, deadline)
+            ):
+                raise GeminiOverloadedError("Gemini rate limit would be exceeded before the deadline")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise GeminiOverloadedError("Deadline reached before calling Gemini")
+
+            try:
+                return self.model.generate_content(prompt, request_options={"timeout": remaining})
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                # Full jitter: spreads retries of concurrent callers instead of synchronising them
+                backoff = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+                if time.monotonic() + backoff >= deadline or (cancelled is not None and cancelled.is_set()):
+                    raise
+                attempt += 1
+                with self._lock:
+                    self._stats["retries"] += 1
+                self.logger.warning(f"Gemini call failed ({e.__class__.__name__}), retry {attempt} in {backoff:.2f}s")
+                if cancelled is not None:
+                    # Wakes up early when the other hedged attempt wins
+                    cancelled.wait(backoff)
+                else:
+                    time.sleep(backoff)
+
+    def _hedge_delay(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < 20:
+            return self.hedge_default_delay
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))]
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency * 2, thread_name_prefix="gemini-hedge")
+            return self._executor
+
+    def _try_start_hedge(self, prompt):
+        """
+        Reserve a hedge: within budget, with a free slot and the rate limit tokens of
+        its first attempt available right now (taken here, so they're counted once).
+        """
+        with self._lock:
+            if self._stats["hedged"] + 1 > self.hedge_budget * self._stats["requests"]:
+                return False
+        if not self._slots.acquire(blocking=False):
+            return False
+        now = time.monotonic()
+        if not self.request_bucket.acquire(1, now):
+            self._slots.release()
+            return False
+        if not self.token_bucket.acquire(self._estimated_tokens(prompt), now):
+            self.request_bucket.refund(1)
+            self._slots.release()
+            return False
+        with self._lock:
+            self._stats["hedged"] += 1
+            self._stats["in_flight"] += 1
+        return True
+
+    def _run_attempt(self, prompt, deadline, cancelled, prepaid=False):
+        """One hedged attempt; owns a concurrency slot until its own request has returned."""
+        try:
+            return self._call_with_retries(prompt, deadline, cancelled, prepaid)
+        finally:
+            self._release_slot()
+
+    def _call_hedged(self, prompt, deadline):
+        """
+        Run the call; if it hasn't returned after the hedge delay, race an identical
+        request against it. The loser can't abort an HTTP call already in flight: it
+        keeps its slot until that call returns (the response is discarded) and stops
+        before any retry or backoff.
+        """
+        executor = self._get_executor()
+        primary_cancelled = threading.Event()
+        try:
+            primary = executor.submit(self._run_attempt, prompt, deadline, primary_cancelled)
+        except Exception:
+            self._release_slot()
+            raise
+        delay = min(self._hedge_delay(), max(0.0, deadline - time.monotonic()))
+
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._try_start_hedge(prompt):
+            return primary.result()
+
+        self.logger.info(f"Gemini call exceeded {delay:.2f}s, sending hedged request")
+        hedge_cancelled = threading.Event()
+        try:
+            hedge = executor.submit(self._run_attempt, prompt, deadline, hedge_cancelled, True)
+        except Exception:
+            self._release_slot()
+            return primary.result()
+        cancel = {primary: primary_cancelled, hedge: hedge_cancelled}
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        cancel[other].set()
+                    if future is hedge:
+                        with self._lock:
+                            self._stats["hedge_wins"] += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @property
+    def breaker_state(self):
+        """closed | open | half_open"""
+        with self._lock:
+            if not self._breaker_open_until:
+                return "closed"
+            return "open" if time.monotonic() < self._breaker_open_until else "half_open"
+
+    def stats(self):
+        """Counters plus queue wait percentiles (ms) over the last 1000 admitted calls."""
+        with self._lock:
+            stats = dict(self._stats)
+            waits = sorted(self._queue_waits)
+        stats["max_concurrency"] = self.max_concurrency
+        stats["max_queue"] = self.max_queue
+        stats["breaker_state"] = self.breaker_state
+        stats["queue_wait_p50_ms"] = round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0
+        stats["queue_wait_p99_ms"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.99))] * 1000, 1) if waits else 0.0
+        stats["hedge_rate"] = round(stats["hedged"] / stats["requests"], 4) if stats["requests"] else 0.0
+        stats["hedge_win_rate"] = round(stats["hedge_wins"] / stats["hedged"], 4) if stats["hedged"] else 0.0
+        return stats
@@ -0,0 +1,249 @@
+import os
+import time
+import queue
+import logging
+import threading
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import Future
+
+
+class PipelineStage:
+    """
+    One step of an ingestion pipeline.
+
+    Args:
+        name (str): Stage name (used in logs and metrics)
+        handler (callable): Called with the PipelineJob; mutates job.payload
+        workers (int): Number of worker threads for this stage
+    """
+
+    def __init__(self, name, handler, workers=1):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+
+
+class StageMeter:
+    """
+    Metrics of a streaming sub-stage that runs inside a pipeline stage on batches
+    rather than jobs (e.g. chunk -> embed -> write inside "index"). Reported
+    alongside the pipeline stages.
+
+    Args:
+        name (str): Sub-stage name
+        workers (int): Number of threads running the sub-stage per stream
+    """
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self._lock = threading.Lock()
+        self._stats = {"processed": 0, "failed": 0, "busy_seconds": 0.0, "active": 0, "queued": 0}
+
+    @contextmanager
+    def measure(self):
+        """Time one batch of work."""
+        with self._lock:
+            self._stats["active"] += 1
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self._stats["active"] -= 1
+                self._stats["busy_seconds"] += time.perf_counter() - start
+                self._stats["failed" if failed else "processed"] += 1
+
+    def queued(self, delta):
+        """Track batches waiting in the sub-stage's input queue."""
+        with self._lock:
+            self._stats["queued"] += delta
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+class PipelineJob:
+    """A unit of work (one S3 object) flowing through the pipeline."""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.future = Future()
+        # Resources (temp files, ...) released when the job leaves the pipeline
+        self.resources = ExitStack()
+        self.finished = False
+        self.result = None
+
+    def finish(self, result=None):
+        """Stop the job early; later stages are skipped."""
+        self.finished = True
+        self.result = result
+
+
+class IngestionPipeline:
+    """
+    Staged pipeline connecting stages through bounded queues.
+
+    Every stage has its own worker threads, so downloads, extraction, embedding and
+    writes of different jobs overlap. A full queue blocks the upstream stage, which
+    keeps the number of in-flight jobs (and memory) bounded.
+    """
+
+    def __init__(self, name, stages, queue_size=None, report_interval=None, meters=()):
+        self.name = name
+        self.stages = stages
+        # Sub-stages (StageMeter) streamed inside a stage, reported with the stages
+        self.meters = list(meters)
+        self.queue_size = queue_size or int(os.getenv("PIPELINE_QUEUE_SIZE", 2))
+        self.report_interval = report_interval or float(os.getenv("PIPELINE_REPORT_INTERVAL_SECONDS", 30))
+
+        self.logger = logging.getLogger(f"{self.__class__.__name__}[{name}]")
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+        self._queues = [queue.Queue(maxsize=self.queue_size) for _ in stages]
+        self._stats = {
+            stage.name: {"processed": 0, "failed": 0, "busy_seconds": 0.0, "active": 0}
+            for stage in stages
+        }
+        self._stats_lock = threading.Lock()
+        self._started_at = None
+        self._start_lock = threading.Lock()
+
+    @staticmethod
+    def stage_workers(stage_name, default):
+        """Read the worker count of a stage from PIPELINE_<STAGE>_WORKERS."""
+        return int(os.getenv(f"PIPELINE_{stage_name.upper()}_WORKERS", default))
+
+    def start(self):
+        with self._start_lock:
+            if self._started_at is not None:
+                return
+            self._started_at = time.monotonic()
+
+            for index, stage in enumerate(self.stages):
+                for worker in range(stage.workers):
+                    threading.Thread(
+                        target=self._work,
+                        args=(index,),
+                        name=f"{self.name}-{stage.name}-{worker}",
+                        daemon=True
+                    ).start()
+
+            threading.Thread(target=self._report, name=f"{self.name}-metrics", daemon=True).start()
+            self.logger.info(
+                "Pipeline started: " + ", ".join(f"{stage.name}x{stage.workers}" for stage in self.stages)
+                + "".join(f" | {meter.name}x{meter.workers}" for meter in self.meters)
+            )
+
+    def submit(self, payload):
+        """
+        Queue a job; blocks while the first stage's queue is full.
+
+        Returns:
+            Future: Resolves to the job result, or raises the stage error
+        """
+        self.start()
+        job = PipelineJob(payload)
+        self._queues[0].put(job)
+        return job.future
+
+    def run(self, payload):
+        """Submit a job and wait for it to complete."""
+        return self.submit(payload).result()
+
+    def _work(self, index):
+        stage = self.stages[index]
+        stats = self._stats[stage.name]
+        inbox = self._queues[index]
+
+        while True:
+            job = inbox.get()
+            start = time.perf_counter()
+            with self._stats_lock:
+                stats["active"] += 1
+            try:
+                stage.handler(job)
+            except Exception as e:
+                self.logger.error(f"Stage '{stage.name}' failed: {e}")
+                with self._stats_lock:
+                    stats["failed"] += 1
+                self._complete(job, error=e)
+                continue
+            finally:
+                with self._stats_lock:
+                    stats["active"] -= 1
+                    stats["busy_seconds"] += time.perf_counter() - start
+
+            with self._stats_lock:
+                stats["processed"] += 1
+
+            if job.finished or index == len(self.stages) - 1:
+                self._complete(job)
+            else:
+                # Blocks when the next stage is saturated (backpressure)
+                self._queues[index + 1].put(job)
+
+    def _complete(self, job, error=None):
+        try:
+            job.resources.close()
+        except Exception as e:
+            self.logger.warning(f"Failed to release job resources: {e}")
+
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(job.result)
+
+    def stats(self):
+        """
+        Per-stage metrics: jobs processed/failed, throughput (jobs/min),
+        utilisation of the stage's workers and current input queue depth.
+        Sub-stage meters report the same figures counted in batches.
+        """
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        result = {}
+        with self._stats_lock:
+            for stage, inbox in zip(self.stages, self._queues):
+                stats = self._stats[stage.name]
+                result[stage.name] = {
+                    "workers": stage.workers,
+                    "processed": stats["processed"],
+                    "failed": stats["failed"],
+                    "active": stats["active"],
+                    "queue_depth": inbox.qsize(),
+                    "throughput_per_min": (stats["processed"] * 60 / elapsed) if elapsed else 0.0,
+                    "utilisation": (stats["busy_seconds"] / (elapsed * stage.workers)) if elapsed else 0.0
+                }
+        for meter in self.meters:
+            stats = meter.snapshot()
+            result[meter.name] = {
+                "workers": meter.workers,
+                "processed": stats["processed"],
+                "failed": stats["failed"],
+                "active": stats["active"],
+                "queue_depth": stats["queued"],
+                "throughput_per_min": (stats["processed"] * 60 / elapsed) if elapsed else 0.0,
+                "utilisation": (stats["busy_seconds"] / (elapsed * meter.workers)) if elapsed else 0.0
+            }
+        return result
+
+    def _report(self):
+        last_snapshot = None
+        while True:
+            time.sleep(self.report_interval)
+            stats = self.stats()
+            snapshot = {name: (s["processed"], s["failed"], s["active"], s["queue_depth"]) for name, s in stats.items()}
+            if snapshot == last_snapshot:
+                continue
+            last_snapshot = snapshot
+
+            self.logger.info("Pipeline stats | " + " | ".join(
+                f"{name}: done={s['processed']} failed={s['failed']} active={s['active']} "
+                f"queued={s['queue_depth']} rate={s['throughput_per_min']:.1f}/min util={s['utilisation']:.0%}"
+                for name, s in stats.items()
+            ))
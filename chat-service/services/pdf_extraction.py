@@ -0,0 +1,268 @@
+"""
+PDF page extraction backends and helpers that can run in worker processes.
+
+Kept free of heavy imports (torch, langchain, ...) so spawned workers start fast.
+Native backends (pdfium, MuPDF) are imported lazily and only used when installed;
+PyPDF2 is always available as the fallback.
+"""
+import os
+import sys
+import time
+import difflib
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PyPDF2 import PdfReader
+
+
+logger = logging.getLogger(__name__)
+
+# Bump when extraction output changes, so cached artifacts of older versions are not reused
+EXTRACTOR_VERSION = "1"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# pypdfium2 isn't thread-safe: every PDFium call of this process goes through this
+# lock, so several index workers (PIPELINE_INDEX_WORKERS > 1) can extract at once
+_pdfium_lock = threading.Lock()
+
+
+class PdfBackend:
+    """Common interface of PDF text extraction engines."""
+
+    name = None
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def page_count(self, file_path):
+        raise NotImplementedError
+
+    def iter_pages(self, file_path, start, end):
+        """
+        Open the file once and yield (page_num, text) for pages [start, end), page_num is 1-based.
+        """
+        raise NotImplementedError
+
+    def extract_page_range(self, file_path, start, end):
+        return list(self.iter_pages(file_path, start, end))
+
+
+class PdfiumBackend(PdfBackend):
+    """
+    pypdfium2 (Chromium's PDFium): native, fast text extraction.
+    Calls are serialised per process by _pdfium_lock (released between pages).
+    """
+
+    name = "pdfium"
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import pypdfium2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def page_count(self, file_path):
+        import pypdfium2 as pdfium
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(file_path)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+
+    def iter_pages(self, file_path, start, end):
+        import pypdfium2 as pdfium
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(file_path)
+        try:
+            for page_num in range(start, end):
+                with _pdfium_lock:
+                    page = pdf[page_num]
+                    text_page = page.get_textpage()
+                    text = text_page.get_text_range()
+                    text_page.close()
+                    page.close()
+                yield page_num + 1, text
+        finally:
+            with _pdfium_lock:
+                pdf.close()
+
+
+class PyMuPDFBackend(PdfBackend):
+    """PyMuPDF (MuPDF bindings)."""
+
+    name = "pymupdf"
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import fitz  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def page_count(self, file_path):
+        import fitz
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+
+    def iter_pages(self, file_path, start, end):
+        import fitz
+        with fitz.open(file_path) as doc:
+            for page_num in range(start, end):
+                yield page_num + 1, doc[page_num].get_text()
+
+
+class PyPDF2Backend(PdfBackend):
+    """Pure-Python fallback."""
+
+    name = "pypdf2"
+
+    def page_count(self, file_path):
+        return len(PdfReader(file_path).pages)
+
+    def iter_pages(self, file_path, start, end):
+        reader = PdfReader(file_path)
+        for page_num in range(start, end):
+            yield page_num + 1, reader.pages[page_num].extract_text() or ""
+
+
+# In order of preference for PDF_BACKEND=auto
+BACKENDS = {backend.name: backend for backend in (PdfiumBackend, PyMuPDFBackend, PyPDF2Backend)}
+
+
+def get_backend(name=None):
+    """
+    Resolve the configured backend (PDF_BACKEND: auto | pdfium | pymupdf | pypdf2).
+    Falls back to the next available engine when the requested one isn't installed.
+    """
+    name = (name or os.getenv("PDF_BACKEND", "auto")).lower()
+
+    if name != "auto":
+        backend = BACKENDS.get(name)
+        if backend is None:
+            raise ValueError(f"Unknown PDF backend: {name}")
+        if backend.is_available():
+            return backend()
+        logger.warning(f"PDF backend '{name}' is not installed, falling back to auto selection")
+
+    for backend in BACKENDS.values():
+        if backend.is_available():
+            return backend()
+    return PyPDF2Backend()
+
+
+def extract_page_range(backend_name, file_path, start, end):
+    """
+    Extract pages [start, end) with the named backend. Runs inside a pool worker,
+    which opens the file from the local temp path itself so no page data crosses
+    process boundaries.
+    """
+    return BACKENDS[backend_name]().extract_page_range(file_path, start, end)
+
+
+def pool_workers():
+    """Worker processes of the extraction pool (PDF_EXTRACT_WORKERS)."""
+    return int(os.getenv("PDF_EXTRACT_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+
+
+def get_pool():
+    """Process pool shared by all extractions in this process (created on first use)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = pool_workers()
+            # spawn: forking a process that already runs torch/listener threads is unsafe
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def iter_pages_parallel(backend, file_path, page_count, pages_per_task=None):
+    """
+    Extract a PDF across the process pool and yield pages in order.
+
+    At most PDF_MAX_INFLIGHT_RANGES page ranges (default 2 x pool workers) are
+    submitted or waiting to be consumed at any time; the next range is submitted
+    as each one is yielded, so a slow consumer bounds memory instead of letting
+    finished ranges pile up.
+
+    Yields:
+        tuple: (page_num, text)
+    """
+    pages_per_task = pages_per_task or int(os.getenv("PDF_PAGES_PER_TASK", 25))
+    pool = get_pool()
+    max_inflight = int(os.getenv("PDF_MAX_INFLIGHT_RANGES", 2 * pool_workers()))
+    starts = iter(range(0, page_count, pages_per_task))
+    futures = deque()
+
+    def submit_next():
+        start = next(starts, None)
+        if start is not None:
+            futures.append(pool.submit(
+                extract_page_range, backend.name, file_path, start, min(start + pages_per_task, page_count)
+            ))
+
+    try:
+        for _ in range(max(1, max_inflight)):
+            submit_next()
+        while futures:
+            pages = futures.popleft().result()
+            submit_next()
+            for page in pages:
+                yield page
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def benchmark(file_paths, backend_names=None):
+    """
+    Compare installed backends on a corpus of PDFs: pages/sec and output parity
+    (word-level similarity against the PyPDF2 reference output).
+
+    Returns:
+        dict: backend name -> {"pages", "seconds", "pages_per_sec", "parity"}
+    """
+    backend_names = backend_names or [name for name, backend in BACKENDS.items() if backend.is_available()]
+    reference = PyPDF2Backend()
+    reference_texts = {}
+    results = {}
+
+    for name in backend_names:
+        backend = BACKENDS[name]()
+        pages, seconds, parity = 0, 0.0, []
+        for file_path in file_paths:
+            count = backend.page_count(file_path)
+            start = time.perf_counter()
+            text = "\n".join(page_text for _, page_text in backend.iter_pages(file_path, 0, count))
+            seconds += time.perf_counter() - start
+            pages += count
+
+            if file_path not in reference_texts:
+                reference_texts[file_path] = "\n".join(
+                    page_text for _, page_text in reference.iter_pages(file_path, 0, count)
+                )
+            parity.append(difflib.SequenceMatcher(None, reference_texts[file_path].split(), text.split()).ratio())
+
+        results[name] = {
+            "pages": pages,
+            "seconds": seconds,
+            "pages_per_sec": pages / seconds if seconds else 0.0,
+            "parity": sum(parity) / len(parity) if parity else 0.0
+        }
+    return results
+
+
+if __name__ == "__main__":
+    # python -m services.pdf_extraction file1.pdf file2.pdf ...
+    for backend_name, result in benchmark(sys.argv[1:]).items():
+        print(f"{backend_name:8s} {result['pages']:6d} pages  {result['pages_per_sec']:8.1f} pages/sec  "
+              f"parity={result['parity']:.3f}")
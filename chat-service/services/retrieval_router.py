@@ -0,0 +1,133 @@
+"""
+Decides per chat turn whether vector retrieval is needed.
+
+Conversational follow-ups ("thanks!", "can you shorten that?", "translate your
+last answer") are answered from the conversation history alone, so the query
+embedding, the project lookup and both vector searches are skipped for them.
+The router is pure regex heuristics: it runs in microseconds and never touches
+the model or the database.
+
+RETRIEVAL_ROUTER_MODE:
+- auto: route with the heuristics (default)
+- always: always retrieve (router disabled)
+- never: never retrieve when there is history to answer from
+A single request can override the mode with the same values.
+"""
+import os
+import re
+import logging
+import threading
+
+
+RETRIEVE = "retrieve"
+HISTORY = "history"
+
+MODES = ("auto", "always", "never")
+
+# Whole-turn acknowledgements / small talk (English and Vietnamese). Bare yes/no
+# answers aren't included: they often accept an offer from the previous answer
+# ("do you want the steps from the deployment doc?"), which needs retrieval.
+_SMALL_TALK = re.compile(
+    r"^(?:(?:ok(?:ay)?|k|cool|great|nice|perfect|awesome|got it|i see|understood|"
+    r"thanks?(?: you)?(?: so much| a lot)?|thx|ty|cheers|bye|goodbye|hi|hello|hey|good job|well done|"
+    r"cảm ơn(?: bạn)?|cám ơn|ok(?:e)? nhé|được rồi|hiểu rồi|tốt|tuyệt|chào(?: bạn)?)"
+    r"[\s!.,?😀-🙏👍🙂]*)+$",
+    re.IGNORECASE
+)
+
+# Operations on the previous answer rather than new questions about the content. The
+# verb has to open the turn (after an optional "please" / "can you") and be followed
+# directly by a reference to the previous answer: "your answer", "what you said", or
+# it/that/this on its own ("rewrite this function" is a new question)
+_POLITE_PREFIX = r"(?:(?:please|pls|ok(?:ay)?|now|(?:can|could|would) you|hãy|bạn có thể|làm ơn)[\s,]+)*"
+_ANSWER_REFERENCE = (
+    r"(?:your (?:last |previous )?(?:answer|response|reply)|what you (?:just )?said|"
+    r"câu trả lời (?:trên|trước|vừa rồi)|(?:lại )?(?:ở trên|đó|này))"
+)
+_PRONOUN = (
+    r"(?:it|that|this)(?=\s*(?:$|[.,!?]|(?:in|into|to|as|for|again|please|more|briefly|bằng|sang|giúp)\b))"
+)
+_REWRITE = re.compile(
+    r"^" + _POLITE_PREFIX + r"(?:"
+    r"(?:shorten|summari[sz]e|condense|translate|rephrase|reword|rewrite|simplify|"
+    r"dịch|tóm tắt|rút gọn|viết lại)\s+(?:" + _ANSWER_REFERENCE + r"|" + _PRONOUN + r")"
+    r"|explain (?:it|that|this|" + _ANSWER_REFERENCE + r") again)",
+    re.IGNORECASE
+)
+# Rewrites that name the knowledge base ("summarize this document") are real retrievals
+_CONTENT_NOUNS = re.compile(
+    r"\b(?:document|doc|file|pdf|video|lesson|project|slide|page|chapter|section|tài liệu)s?\b",
+    re.IGNORECASE
+)
+# Longer turns are likely to bring new content that needs retrieval
+_MAX_REWRITE_WORDS = 12
+
+
+class RetrievalRouter:
+    """
+    Classifies chat turns as needing retrieval or answerable from history, and
+    counts the decisions so the skip rate can be monitored.
+    """
+
+    def __init__(self, mode=None):
+        self.mode = (mode or os.getenv("RETRIEVAL_ROUTER_MODE", "auto")).lower()
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown retrieval router mode: {self.mode}")
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+        self._lock = threading.Lock()
+        self._stats = {"turns": 0, "skipped": 0, "reasons": {}}
+
+    def route(self, question, has_history, override=None):
+        """
+        Decide whether a turn needs retrieval.
+
+        Args:
+            question (str): User's question
+            has_history (bool): Whether the conversation has previous messages
+            override (str, optional): Per-request mode (auto | always | never)
+
+        Returns:
+            tuple: (RETRIEVE or HISTORY, reason)
+        """
+        mode = (override or self.mode).lower()
+        if mode not in MODES:
+            raise ValueError(f"Unknown retrieval router mode: {mode}")
+
+        decision, reason = self._classify(question.strip(), has_history, mode)
+        with self._lock:
+            self._stats["turns"] += 1
+            if decision == HISTORY:
+                self._stats["skipped"] += 1
+            self._stats["reasons"][reason] = self._stats["reasons"].get(reason, 0) + 1
+        return decision, reason
+
+    @staticmethod
+    def _classify(question, has_history, mode):
+        # Without history there is nothing to answer from
+        if not has_history:
+            return RETRIEVE, "no_history"
+        if mode == "always":
+            return RETRIEVE, "forced"
+        if mode == "never":
+            return HISTORY, "forced"
+
+        if _SMALL_TALK.match(question):
+            return HISTORY, "small_talk"
+        if (
+            len(question.split()) <= _MAX_REWRITE_WORDS
+            and _REWRITE.match(question)
+            and not _CONTENT_NOUNS.search(question)
+        ):
+            return HISTORY, "rewrite"
+        return RETRIEVE, "question"
+
+    def stats(self):
+        """Turns routed, turns answered without retrieval, skip rate and counts per reason."""
+        with self._lock:
+            stats = {"turns": self._stats["turns"], "skipped": self._stats["skipped"], "reasons": dict(self._stats["reasons"])}
+        stats["mode"] = self.mode
+        stats["skip_rate"] = round(stats["skipped"] / stats["turns"], 4) if stats["turns"] else 0.0
+        return stats
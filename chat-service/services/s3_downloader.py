@@ -0,0 +1,66 @@
+import os
+import shutil
+import logging
+import tempfile
+import urllib.parse
+from contextlib import contextmanager
+
+from boto3.s3.transfer import TransferConfig
+
+
+MB = 1024 * 1024
+
+
+class S3Downloader:
+    """
+    Streams S3 objects straight to disk instead of buffering them in memory.
+
+    Large objects are fetched with ranged, parallel GETs (boto3's managed transfer),
+    each part is written to the target file as it arrives, so memory stays at a few
+    part buffers regardless of object size. Files live in a per-job temp directory
+    that is always removed when the job is done, even if processing raises.
+    """
+
+    def __init__(self, s3_client, temp_root=None):
+        self.s3 = s3_client
+        self.temp_root = temp_root or os.getenv("INGEST_TMP_DIR") or None
+
+        self.transfer_config = TransferConfig(
+            multipart_threshold=int(os.getenv("S3_MULTIPART_THRESHOLD_MB", 16)) * MB,
+            multipart_chunksize=int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", 8)) * MB,
+            max_concurrency=int(os.getenv("S3_DOWNLOAD_CONCURRENCY", 4)),
+            io_chunksize=256 * 1024,
+            max_io_queue=16,
+            use_threads=True
+        )
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+        if self.temp_root:
+            os.makedirs(self.temp_root, exist_ok=True)
+
+    @contextmanager
+    def download(self, bucket, key):
+        """
+        Download s3://bucket/key into a managed temp directory.
+
+        Args:
+            bucket (str): S3 bucket name
+            key (str): S3 object key (URL-encoded, as delivered in S3 events)
+
+        Yields:
+            str: Local file path, keeping the original file extension
+
+        Raises:
+            ClientError: If the S3 download fails
+        """
+        decoded_key = urllib.parse.unquote_plus(key)
+        job_dir = tempfile.mkdtemp(prefix="ingest-", dir=self.temp_root)
+        try:
+            file_path = os.path.join(job_dir, os.path.basename(decoded_key) or "object")
+            self.s3.download_file(bucket, decoded_key, file_path, Config=self.transfer_config)
+            self.logger.info(f"Downloaded s3://{bucket}/{decoded_key} to {file_path} ({os.path.getsize(file_path)} bytes)")
+            yield file_path
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
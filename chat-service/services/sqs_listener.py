@@ -1,12 +1,10 @@
 import os
-import time
 import logging
 import json
+import threading
 from dotenv import load_dotenv
 import boto3
 from botocore.exceptions import ClientError
-from services.document_service import DocumentService
-from services.video_service import VideoService
 from config.config import create_app
 
 class SQSListener:
@@ -33,6 +31,9 @@ class SQSListener:
         
         # Initialize appropriate service based on queue URL
         if "document" in self.queue_url.lower():
+            # Imported per queue type so a document worker never loads the video stack (and vice versa)
+            from services.document_service import DocumentService
+
             # Create Flask app instance for database context
             app, _ = create_app()
             self.document_service = DocumentService(app)
@@ -40,6 +41,8 @@ class SQSListener:
             self.logger.info("Initialized DocumentService for document queue")
             
         elif "video" in self.queue_url.lower():
+            from services.video_service import VideoService
+
             # Create Flask app instance for database context
             app, _ = create_app()
             self.video_service = VideoService(app)
@@ -49,11 +52,35 @@ class SQSListener:
             self.service_type = None
             self.logger.warning("Unknown queue type, no service initialized")
         
+        self._stop = threading.Event()
         self.logger.info(f"SQSListener initialized for queue: {self.queue_url}")
 
+    def _embedding_service(self):
+        if self.service_type == "document":
+            return self.document_service.embedding_service
+        if self.service_type == "video":
+            return self.video_service.embedding_service
+        return None
+
+    def stop(self):
+        """Stop after the current receive batch; listen() then releases the embedding pool."""
+        self._stop.set()
+
     def listen(self):
         self.logger.info("Start listening to SQS queue...")
-        while True:
+        # Embedding worker processes live as long as at least one listener is running
+        embedding_service = self._embedding_service()
+        if embedding_service is not None:
+            embedding_service.embedding_pool.acquire()
+        try:
+            self._listen()
+        finally:
+            if embedding_service is not None:
+                embedding_service.embedding_pool.release()
+            self.logger.info("Stopped listening to SQS queue")
+
+    def _listen(self):
+        while not self._stop.is_set():
             try:
                 response = self.sqs.receive_message(
                     QueueUrl=self.queue_url,
@@ -64,6 +91,8 @@ class SQSListener:
                 if not messages:
                     continue
 
+                # Submit the whole batch first so the pipeline can overlap its stages across messages
+                submitted = []
                 for message in messages:
                     self.logger.info(f"Received message: {message['Body']}")
                     
@@ -72,12 +101,21 @@ class SQSListener:
                         
                         # Route to appropriate service based on queue type
                         if self.service_type == "document":
-                            self.document_service.process_s3_event(event_json)
+                            futures = self.document_service.submit_s3_event(event_json)
                         elif self.service_type == "video":
-                            self.video_service.process_s3_event(event_json)
+                            futures = self.video_service.submit_s3_event(event_json)
                         else:
                             self.logger.error(f"Unknown service type: {self.service_type}")
                             continue
+                        submitted.append((message, futures))
+                        
+                    except Exception as e:
+                        self.logger.error(f"Error processing message: {e}")
+
+                for message, futures in submitted:
+                    try:
+                        for future in futures:
+                            future.result()
                         
                         # Delete message after successful processing
                         self.sqs.delete_message(
@@ -92,7 +130,7 @@ class SQSListener:
 
             except ClientError as e:
                 self.logger.error(f"AWS ClientError: {e}")
-                time.sleep(5)
+                self._stop.wait(5)
             except Exception as e:
                 self.logger.error(f"Unexpected error: {e}")
-                time.sleep(5)
+                self._stop.wait(5)
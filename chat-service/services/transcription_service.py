@@ -0,0 +1,569 @@
+"""
+Whisper transcription engine for uploaded videos.
+
+The audio track is decoded once to 16 kHz mono, split at silent points into
+segments of roughly TRANSCRIBE_SEGMENT_SECONDS, and the segments are transcribed
+across a process pool. Segment timestamps are shifted back onto the original
+timeline before the transcript is stitched together.
+
+With TRANSCRIBE_VAD enabled, an energy-based voice-activity pass runs first and
+only the speech regions are packed into segments, so long silent stretches of
+screen recordings never reach Whisper.
+
+Two inference backends are supported (TRANSCRIBE_BACKEND): openai-whisper (the
+default) and faster-whisper, which runs the same Whisper models through CTranslate2
+with int8 quantization and is several times faster on CPU. faster-whisper is opt-in
+(TRANSCRIBE_BACKEND=faster-whisper or auto): compare its WER on your own content with
+benchmark() before switching, since int8 weights change the transcripts.
+"""
+import os
+import sys
+import time
+import logging
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from services import workload_budget
+
+
+SAMPLE_RATE = 16000
+# Bump when the segment format or post-processing changes (invalidates cached transcripts)
+TRANSCRIPT_VERSION = "1"
+FRAME_SECONDS = 0.03
+
+# Backend and model held by each pool worker process
+_worker_backend = None
+_worker_model = None
+
+
+def decode_audio(file_path, sample_rate=SAMPLE_RATE):
+    """
+    Decode the audio track of a media file to mono float32 PCM with ffmpeg.
+
+    Returns:
+        np.ndarray: Samples in [-1, 1] at sample_rate
+    """
+    command = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", file_path,
+        "-vn", "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-"
+    ]
+    try:
+        output = subprocess.run(command, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to decode audio: {e.stderr.decode(errors='ignore')[-500:]}") from e
+
+    return np.frombuffer(output, np.int16).astype(np.float32) / 32768.0
+
+
+def frame_energy(audio, sample_rate=SAMPLE_RATE):
+    """RMS energy of consecutive FRAME_SECONDS frames."""
+    frame = int(sample_rate * FRAME_SECONDS)
+    frames = len(audio) // frame
+    if frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.sqrt(np.mean(audio[:frames * frame].reshape(frames, frame) ** 2, axis=1))
+
+
+def split_on_silence(audio, target_seconds, max_seconds, sample_rate=SAMPLE_RATE):
+    """
+    Split audio into segments of about target_seconds, cutting at the quietest frame
+    between 0.75 * target_seconds and max_seconds after the previous cut.
+
+    Returns:
+        list: (start_sample, end_sample) tuples covering the whole audio
+    """
+    total = len(audio)
+    if total <= max_seconds * sample_rate:
+        return [(0, total)]
+
+    energy = frame_energy(audio, sample_rate)
+    frame = int(sample_rate * FRAME_SECONDS)
+    bounds = []
+    start = 0
+
+    while total - start > max_seconds * sample_rate:
+        window_start = (start + int(target_seconds * 0.75 * sample_rate)) // frame
+        window_end = min((start + int(max_seconds * sample_rate)) // frame, len(energy))
+        if window_end <= window_start:
+            cut = start + int(max_seconds * sample_rate)
+        else:
+            cut = (window_start + int(np.argmin(energy[window_start:window_end]))) * frame
+        bounds.append((start, cut))
+        start = cut
+
+    bounds.append((start, total))
+    return bounds
+
+
+def detect_speech(audio, sample_rate=SAMPLE_RATE, min_speech_seconds=0.25, min_silence_seconds=0.6, padding_seconds=0.2):
+    """
+    Energy-based voice-activity detection.
+
+    A frame counts as speech when it is 12 dB above the recording's noise floor
+    (10th percentile of frame energy) and above an absolute -50 dBFS floor. Gaps
+    shorter than min_silence_seconds are bridged, blips shorter than
+    min_speech_seconds dropped, and regions padded so word edges aren't clipped.
+
+    Returns:
+        list: (start_sample, end_sample) speech regions in timeline order
+    """
+    energy = frame_energy(audio, sample_rate)
+    if len(energy) == 0:
+        return []
+
+    frame = int(sample_rate * FRAME_SECONDS)
+    db = 20 * np.log10(energy + 1e-10)
+    threshold = max(float(np.percentile(db, 10)) + 12.0, -50.0)
+    is_speech = db > threshold
+
+    regions = []
+    start = None
+    for index, speech in enumerate(is_speech):
+        if speech and start is None:
+            start = index
+        elif not speech and start is not None:
+            regions.append([start, index])
+            start = None
+    if start is not None:
+        regions.append([start, len(is_speech)])
+
+    min_silence = int(min_silence_seconds / FRAME_SECONDS)
+    merged = []
+    for region in regions:
+        if merged and region[0] - merged[-1][1] < min_silence:
+            merged[-1][1] = region[1]
+        else:
+            merged.append(region)
+
+    min_speech = int(min_speech_seconds / FRAME_SECONDS)
+    padding = int(padding_seconds * sample_rate)
+    speech = []
+    for region_start, region_end in merged:
+        if region_end - region_start < min_speech:
+            continue
+        start_sample = max(0, region_start * frame - padding)
+        end_sample = min(len(audio), region_end * frame + padding)
+        if speech and start_sample <= speech[-1][1]:
+            speech[-1] = (speech[-1][0], end_sample)
+        else:
+            speech.append((start_sample, end_sample))
+    return speech
+
+
+def pack_speech_regions(audio, regions, target_seconds, max_seconds, sample_rate=SAMPLE_RATE):
+    """
+    Pack speech regions into transcription segments of about target_seconds.
+    Regions longer than max_seconds are split at silence first.
+
+    Returns:
+        list: Segments, each a list of (start_sample, end_sample) pieces to concatenate
+    """
+    segments = []
+    current, current_length = [], 0
+    target = target_seconds * sample_rate
+
+    for region_start, region_end in regions:
+        for start, end in split_on_silence(audio[region_start:region_end], target_seconds, max_seconds, sample_rate):
+            piece = (region_start + start, region_start + end)
+            if current and current_length + (piece[1] - piece[0]) > target:
+                segments.append(current)
+                current, current_length = [], 0
+            current.append(piece)
+            current_length += piece[1] - piece[0]
+
+    if current:
+        segments.append(current)
+    return segments
+
+
+def _segment_audio(audio, pieces, sample_rate=SAMPLE_RATE):
+    """
+    Concatenate the pieces of a segment.
+
+    Returns:
+        tuple: (samples, time_map) where time_map lists (segment_offset, original_start, duration) in seconds
+    """
+    time_map = []
+    offset = 0
+    for start, end in pieces:
+        time_map.append((offset / sample_rate, start / sample_rate, (end - start) / sample_rate))
+        offset += end - start
+
+    if len(pieces) == 1:
+        start, end = pieces[0]
+        return audio[start:end], time_map
+    return np.concatenate([audio[start:end] for start, end in pieces]), time_map
+
+
+def _to_original_time(seconds, time_map):
+    """Map a timestamp inside a (possibly concatenated) segment back to the original timeline."""
+    for segment_offset, original_start, duration in reversed(time_map):
+        if seconds >= segment_offset:
+            return original_start + min(seconds - segment_offset, duration)
+    return time_map[0][1]
+
+
+class WhisperBackend:
+    """Common interface of Whisper inference engines."""
+
+    name = None
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def load(self, model_name, threads=None):
+        raise NotImplementedError
+
+    def transcribe(self, model, samples, language):
+        """
+        Transcribe 16 kHz mono float32 samples.
+
+        Returns:
+            list: Dicts with start, end (seconds from the start of samples) and text
+        """
+        raise NotImplementedError
+
+
+class OpenAIWhisperBackend(WhisperBackend):
+    """Reference openai-whisper (PyTorch, fp32 on CPU)."""
+
+    name = "openai"
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import whisper  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def load(self, model_name, threads=None):
+        import whisper
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return whisper.load_model(model_name)
+
+    def transcribe(self, model, samples, language):
+        result = model.transcribe(
+            samples,
+            language=language,  # None = auto-detect
+            verbose=None,  # No per-segment console output
+            fp16=False  # CPU inference
+        )
+        return result.get("segments", [])
+
+
+class FasterWhisperBackend(WhisperBackend):
+    """faster-whisper: CTranslate2 inference, int8 weights by default (WHISPER_COMPUTE_TYPE)."""
+
+    name = "faster-whisper"
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import faster_whisper  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def load(self, model_name, threads=None):
+        from faster_whisper import WhisperModel
+        return WhisperModel(
+            model_name,
+            device="cpu",
+            compute_type=os.getenv("WHISPER_COMPUTE_TYPE", "int8"),
+            cpu_threads=threads or 0  # 0 = CTranslate2 default
+        )
+
+    def transcribe(self, model, samples, language):
+        segments, _ = model.transcribe(
+            samples,
+            language=language,
+            beam_size=int(os.getenv("WHISPER_BEAM_SIZE", 5))
+        )
+        # Segments are produced lazily while iterating
+        return [{"start": segment.start, "end": segment.end, "text": segment.text} for segment in segments]
+
+
+# In order of preference for TRANSCRIBE_BACKEND=auto
+BACKENDS = {backend.name: backend for backend in (FasterWhisperBackend, OpenAIWhisperBackend)}
+
+
+def get_backend(name=None):
+    """
+    Resolve the configured backend (TRANSCRIBE_BACKEND: openai (default) | faster-whisper | auto).
+    Falls back to the next available engine when the requested one isn't installed.
+    """
+    name = (name or os.getenv("TRANSCRIBE_BACKEND", "openai")).lower()
+
+    if name != "auto":
+        backend = BACKENDS.get(name)
+        if backend is None:
+            raise ValueError(f"Unknown transcription backend: {name}")
+        if backend.is_available():
+            return backend()
+        logging.getLogger(__name__).warning(f"Transcription backend '{name}' is not installed, falling back to auto selection")
+
+    for backend in BACKENDS.values():
+        if backend.is_available():
+            return backend()
+    return OpenAIWhisperBackend()
+
+
+def _init_worker(backend_name, model_name, threads):
+    """Pool initializer: pin the thread budget and load the model once per worker."""
+    global _worker_backend, _worker_model
+    _worker_backend = BACKENDS[backend_name]()
+    _worker_model = _worker_backend.load(model_name, threads)
+
+
+def _transcribe_segment(samples, time_map, language):
+    """
+    Transcribe one audio segment in a pool worker; timestamps are mapped through time_map.
+
+    Returns:
+        tuple: (segments, seconds spent in the worker)
+    """
+    started = time.perf_counter()
+    segments = _worker_backend.transcribe(_worker_model, samples, language)
+    return _map_segments(segments, time_map), time.perf_counter() - started
+
+
+def _map_segments(segments, time_map):
+    return [
+        {
+            "start": _to_original_time(float(segment["start"]), time_map),
+            "end": _to_original_time(float(segment["end"]), time_map),
+            "text": segment["text"].strip()
+        }
+        for segment in segments
+        if segment.get("text", "").strip()
+    ]
+
+
+class TranscriptionEngine:
+    """
+    Segmented, parallel Whisper transcription.
+
+    The backend comes from TRANSCRIBE_BACKEND and the model size from WHISPER_MODEL
+    (tiny, base, small, medium, large-v3, ...). TRANSCRIBE_WORKERS > 1 transcribes segments in a process pool (each worker holds
+    one model and TRANSCRIBE_THREADS_PER_WORKER inference threads); with 1 worker the
+    segments are transcribed in-process.
+    """
+
+    def __init__(self, model_name=None, workers=None, segment_seconds=None, backend=None):
+        self.backend = backend if isinstance(backend, WhisperBackend) else get_backend(backend)
+        self.model_name = model_name or os.getenv("WHISPER_MODEL", "base")
+        self.workers = workers or int(os.getenv("TRANSCRIBE_WORKERS", 1))
+        self.segment_seconds = segment_seconds or float(os.getenv("TRANSCRIBE_SEGMENT_SECONDS", 60))
+        self.max_segment_seconds = self.segment_seconds * 2
+        self.use_vad = os.getenv("TRANSCRIBE_VAD", "false").lower() == "true"
+        self.threads_per_worker = int(os.getenv(
+            "TRANSCRIBE_THREADS_PER_WORKER",
+            workload_budget.threads(workload_budget.TRANSCRIPTION) or max(1, (os.cpu_count() or 1) // self.workers)
+        ))
+        # Isolated: even a single worker runs in its own process with its own thread budget
+        self.isolated = workload_budget.isolated()
+
+        self.logger = logging.getLogger(self.__class__.__name__)
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+        self._model = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = self.backend.load(self.model_name, workload_budget.threads(workload_budget.TRANSCRIPTION) or None)
+                self.logger.info(f"Whisper model '{self.model_name}' loaded ({self.backend.name})")
+            return self._model
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that already runs torch/listener threads is unsafe
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.backend.name, self.model_name, self.threads_per_worker)
+                )
+                self.logger.info(f"Transcription pool started: {self.workers} workers x {self.threads_per_worker} threads")
+            return self._pool
+
+    def transcribe(self, file_path, language=None):
+        """
+        Transcribe the audio track of a media file.
+
+        Args:
+            file_path (str): Local path of the video/audio file
+            language (str, optional): Language code, None to auto-detect
+
+        Returns:
+            dict: text, segments (start/end in seconds on the original timeline),
+                  duration (seconds of audio), speech_ratio (share of audio sent to
+                  Whisper) and rtf (processing time / duration)
+        """
+        report = {}
+        segments = list(self.iter_transcribe(file_path, language, report))
+        return {
+            "text": " ".join(segment["text"] for segment in segments).strip(),
+            "segments": segments,
+            **report
+        }
+
+    def iter_transcribe(self, file_path, language=None, report=None):
+        """
+        Transcribe the audio track of a media file, yielding Whisper segments in
+        timeline order as soon as the audio segment they belong to is done.
+
+        Args:
+            file_path (str): Local path of the video/audio file
+            language (str, optional): Language code, None to auto-detect
+            report (dict, optional): Filled with duration, speech_ratio and rtf once exhausted
+
+        Yields:
+            dict: start, end (seconds on the original timeline) and text
+        """
+        started = time.perf_counter()
+
+        audio = decode_audio(file_path)
+        duration = len(audio) / SAMPLE_RATE
+        plan = self._plan_segments(audio)
+
+        transcribed_samples = sum(end - start for pieces in plan for start, end in pieces)
+        speech_ratio = transcribed_samples / len(audio) if len(audio) else 0.0
+        self.logger.info(f"Decoded {duration:.0f}s of audio into {len(plan)} segments"
+                         + (f" (VAD: {speech_ratio:.0%} speech, skipping {duration * (1 - speech_ratio):.0f}s)" if self.use_vad else ""))
+
+        count = 0
+        for segment_list in self._transcribe_segments(audio, plan, language):
+            for segment in segment_list:
+                count += 1
+                yield segment
+
+        elapsed = time.perf_counter() - started
+        rtf = elapsed / duration if duration else 0.0
+        self.logger.info(f"Transcribed {duration:.0f}s of audio in {elapsed:.0f}s (RTF {rtf:.2f}, {count} segments)")
+
+        if report is not None:
+            report.update({"duration": duration, "speech_ratio": speech_ratio, "rtf": rtf})
+
+    def artifact_version(self, language=None):
+        """Identity of this engine's output, used to key cached transcripts."""
+        return (f"{TRANSCRIPT_VERSION}:{self.backend.name}:{self.model_name}:{language or 'auto'}:"
+                f"vad={self.use_vad}:{self.segment_seconds:g}")
+
+    def _plan_segments(self, audio):
+        """Segments to transcribe, each a list of (start_sample, end_sample) pieces."""
+        if self.use_vad:
+            regions = detect_speech(audio)
+            return pack_speech_regions(audio, regions, self.segment_seconds, self.max_segment_seconds)
+        return [[bounds] for bounds in split_on_silence(audio, self.segment_seconds, self.max_segment_seconds)]
+
+    def _transcribe_segments(self, audio, plan, language):
+        """Yield the transcribed segments of each audio segment, in timeline order."""
+        if not self.isolated and (self.workers <= 1 or len(plan) == 1):
+            model = self._get_model()
+            for pieces in plan:
+                samples, time_map = _segment_audio(audio, pieces)
+                with workload_budget.track(workload_budget.TRANSCRIPTION):
+                    segments = self.backend.transcribe(model, samples, language)
+                yield _map_segments(segments, time_map)
+            return
+
+        pool = self._get_pool()
+        # Keep only a few segments in flight so pickled audio doesn't pile up in the pool queue
+        in_flight = []
+        pending = iter(plan)
+
+        def submit(pieces):
+            samples, time_map = _segment_audio(audio, pieces)
+            in_flight.append(pool.submit(_transcribe_segment, samples, time_map, language))
+
+        try:
+            for pieces in pending:
+                submit(pieces)
+                if len(in_flight) >= self.workers * 2:
+                    break
+
+            while in_flight:
+                result, seconds = in_flight.pop(0).result()
+                workload_budget.record(workload_budget.TRANSCRIPTION, seconds)
+                next_pieces = next(pending, None)
+                if next_pieces is not None:
+                    submit(next_pieces)
+                yield result
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def word_error_rate(reference, hypothesis):
+    """Word-level Levenshtein distance divided by the reference length (case and punctuation insensitive)."""
+    def words(text):
+        return "".join(c.lower() if c.isalnum() or c.isspace() else " " for c in text).split()
+
+    ref, hyp = words(reference), words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            )
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def benchmark(file_path, reference_text, backend_names=None, model_name=None, language=None):
+    """
+    Transcribe a fixture clip with every installed backend and compare real-time
+    factor and word error rate against a reference transcript.
+
+    Returns:
+        dict: backend name -> {"rtf", "wer", "seconds"}
+    """
+    backend_names = backend_names or [name for name, backend in BACKENDS.items() if backend.is_available()]
+    results = {}
+
+    for name in backend_names:
+        engine = TranscriptionEngine(model_name=model_name, workers=1, backend=name)
+        # Load outside the timed run
+        engine._get_model()
+        started = time.perf_counter()
+        result = engine.transcribe(file_path, language=language)
+        results[name] = {
+            "rtf": result["rtf"],
+            "wer": word_error_rate(reference_text, result["text"]),
+            "seconds": time.perf_counter() - started
+        }
+        engine.close()
+    return results
+
+
+if __name__ == "__main__":
+    # python -m services.transcription_service clip.mp4 reference.txt [language]
+    with open(sys.argv[2], encoding="utf-8") as reference_file:
+        reference = reference_file.read()
+    language_arg = sys.argv[3] if len(sys.argv) > 3 else None
+    for backend_name, result in benchmark(sys.argv[1], reference, language=language_arg).items():
+        print(f"{backend_name:15s} RTF={result['rtf']:.3f}  WER={result['wer']:.3f}  ({result['seconds']:.1f}s)")
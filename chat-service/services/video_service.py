@@ -1,13 +1,15 @@
 from dotenv import load_dotenv
 import requests
-import tempfile
 import logging
 import boto3
 from botocore.exceptions import ClientError
 import os
 import urllib.parse
 from services.embedding_service import EmbeddingService
-import whisper
+from services.s3_downloader import S3Downloader
+from services.artifact_cache import ArtifactCache
+from services.ingestion_pipeline import IngestionPipeline, PipelineStage
+from services.transcription_service import TranscriptionEngine
 
 
 class VideoService:
@@ -21,6 +23,7 @@ class VideoService:
             aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
             aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")    
         )
+        self.downloader = S3Downloader(self.s3)
         
         self.project_service_url = os.getenv("PROJECT_SERVICE_URL", "http://localhost:7072/api")
         self.api_secret = os.getenv("INTERNAL_API_SECRET")
@@ -28,8 +31,38 @@ class VideoService:
         self.logger = logging.getLogger(self.__class__.__name__)
         logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
         
-        self.whisper_model = whisper.load_model("base")
-        self.logger.info(f"Whisper model loaded successfully")
+        # Decodes audio once and transcribes silence-split segments (optionally across a process pool)
+        self.transcription_engine = TranscriptionEngine()
+        self.logger.info(f"Transcription engine ready (backend={self.transcription_engine.backend.name}, "
+                         f"model={self.transcription_engine.model_name}, workers={self.transcription_engine.workers})")
+
+        # Transcript segments keyed by file hash + engine version, reused when a video is reprocessed
+        self.artifact_cache = ArtifactCache.shared()
+
+        # Pinned transcription languages skip Whisper's language detection.
+        # TRANSCRIBE_PROJECT_LANGUAGES: "projectId=vi,otherProjectId=en"; TRANSCRIBE_LANGUAGE: default for all
+        self.default_language = os.getenv("TRANSCRIBE_LANGUAGE") or None
+        self.project_languages = dict(
+            entry.strip().split("=", 1)
+            for entry in os.getenv("TRANSCRIBE_PROJECT_LANGUAGES", "").split(",")
+            if "=" in entry
+        )
+
+        self.pipeline = self._build_pipeline()
+
+    def _build_pipeline(self):
+        """
+        download -> lookup -> index -> status, connected by bounded queues.
+        The index stage streams transcript segments into chunking, embedding and writes,
+        and shares one Whisper model, so it runs single-worker by default.
+        """
+        workers = IngestionPipeline.stage_workers
+        return IngestionPipeline("video", [
+            PipelineStage("download", self._stage_download, workers("download", 2)),
+            PipelineStage("lookup", self._stage_lookup, workers("lookup", 2)),
+            PipelineStage("index", self._stage_index, workers("index", 1)),
+            PipelineStage("status", self._stage_status, workers("status", 2)),
+        ], meters=self.embedding_service.stream_meters)
 
     def _call_project_service_get_video_id(self, path, type):
         """
@@ -91,67 +124,145 @@ class VideoService:
             json_data: dict JSON from SQS message (S3 event)
         """
         try:
-            for record in json_data.get("Records", []):
-                s3_info = record.get("s3", {})
-                bucket = s3_info.get("bucket", {}).get("name")
-                key = s3_info.get("object", {}).get("key")
-                
-                self.logger.info(f"Processing video from S3: s3://{bucket}/{key}")
-
-                # Download video file from S3
-                video_content = self.download_file(bucket, key)
-                
-                # Transcribe video using Whisper
-                transcript = self.extract_and_transcribe_video(key, video_content)
-                
-                self.logger.info(f"Transcription successful for {key} ({len(transcript)} chars)")
-                
-                # Get video metadata from Project Service
-                video_data = self._call_project_service_get_video_id(key, "video")
-                
-                video_id = video_data.get("videoId")
-                
-                # Chunk and embed the transcript
-                self.chunk_video_transcript(video_id, transcript)
-                
-                # Update video status to COMPLETED
-                self._update_video_status(video_id, status="COMPLETED")
+            for future in self.submit_s3_event(json_data):
+                future.result()
 
         except Exception as e:
             self.logger.error(f"Error processing S3 video event: {e}")
             raise
 
+    def submit_s3_event(self, json_data):
+        """
+        Queue every S3 record of an event into the ingestion pipeline.
+        
+        Args:
+            json_data: dict JSON from SQS message (S3 event)
+            
+        Returns:
+            list[Future]: One future per record
+        """
+        futures = []
+        for record in json_data.get("Records", []):
+            s3_info = record.get("s3", {})
+            bucket = s3_info.get("bucket", {}).get("name")
+            key = s3_info.get("object", {}).get("key")
+            
+            self.logger.info(f"Processing video from S3: s3://{bucket}/{key}")
+            futures.append(self.pipeline.submit({"bucket": bucket, "key": key}))
+        return futures
+
+    def _stage_download(self, job):
+        key = job.payload["key"]
+        # Reject unsupported files before transferring anything
+        try:
+            self._check_video_format(key)
+        except ValueError:
+            self.logger.warning(f"File {key} is not a supported video type. Skipping.")
+            job.finish()
+            return
+
+        # Stream video file from S3 to a temp dir (removed when the job leaves the pipeline)
+        job.payload["video_path"] = job.resources.enter_context(
+            self.download_file(job.payload["bucket"], job.payload["key"])
+        )
+
+    def _stage_lookup(self, job):
+        # Get video metadata from Project Service (the project decides the transcription language)
+        video_data = self._call_project_service_get_video_id(job.payload["key"], "video")
+        job.payload["video_id"] = video_data.get("videoId")
+        job.payload["project_id"] = video_data.get("projectId")
+
+    def _stage_index(self, job):
+        key = job.payload["key"]
+        video_id = job.payload["video_id"]
+
+        language = self.get_transcription_language(job.payload["project_id"])
+        report = {}
+        segments = self.iter_transcript_segments(job.payload["video_path"], language, report)
+
+        try:
+            # Chunks are embedded and written while later audio is still being transcribed
+            num_chunks = self.embedding_service.index_video_stream(video_id, job.payload["project_id"], segments)
+            if num_chunks == 0:
+                self.logger.error(f"Empty transcript from Whisper for {key}")
+                raise Exception("Empty transcript from Whisper")
+        except Exception:
+            # Chunks inserted by this run were removed again, so the previous version stays searchable
+            self._report_failure(video_id)
+            raise
+        # The raw video is no longer needed
+        job.resources.close()
+        if report:
+            self.logger.info(f"Video {video_id}: {num_chunks} transcript chunks indexed, "
+                             f"{report['duration']:.0f}s audio, RTF {report['rtf']:.2f}")
+        else:
+            self.logger.info(f"Video {video_id}: {num_chunks} transcript chunks indexed from cached transcript")
+
+    def _stage_status(self, job):
+        # Update video status to COMPLETED
+        self._update_video_status(job.payload["video_id"], status="COMPLETED")
+        job.finish(job.payload["video_id"])
+
+    def _report_failure(self, video_id):
+        """Mark a video FAILED without hiding the error that failed it."""
+        try:
+            self._update_video_status(video_id, status="FAILED")
+        except Exception as e:
+            self.logger.error(f"Failed to mark video {video_id} as FAILED: {e}")
+
     def download_file(self, bucket, key):
         """
-        Download video file from S3.
+        Stream video file from S3 to local disk.
         
         Args:
             bucket (str): S3 bucket name
             key (str): S3 object key
             
         Returns:
-            bytes: File content
+            contextmanager: Yields the local file path; the file is deleted on exit
             
         Raises:
             ClientError: If S3 download fails
         """
-        try:
-            decoded_key = urllib.parse.unquote_plus(key)
-            response = self.s3.get_object(Bucket=bucket, Key=decoded_key)
-            content = response["Body"].read()
-            self.logger.info(f"Downloaded video file: {len(content)} bytes")
-            return content
-        except ClientError as e:
-            self.logger.error(f"Failed to download s3://{bucket}/{key}: {e}")
-            raise
+        return self.downloader.download(bucket, key)
+
+    def iter_transcript_segments(self, video_path, language=None, report=None):
+        """
+        Transcript segments of a video, from the artifact cache when this file was
+        transcribed before with the same engine settings.
+
+        Args:
+            video_path (str): Local path of the video
+            language (str, optional): Language code, None to auto-detect
+            report (dict, optional): Filled with duration/rtf when Whisper actually runs
+
+        Returns:
+            generator: Segments with start, end and text
+        """
+        return self.artifact_cache.stream(
+            video_path,
+            "transcript",
+            self.transcription_engine.artifact_version(language),
+            lambda: self.transcription_engine.iter_transcribe(video_path, language, report)
+        )
 
-    def extract_and_transcribe_video(self, key, content):
+    def get_transcription_language(self, project_id):
+        """
+        Language pinned for a project's videos.
+        
+        Returns:
+            str: Language code, or None to let Whisper detect it
+        """
+        return self.project_languages.get(str(project_id), self.default_language)
+
+    def extract_and_transcribe_video(self, key, video_path, language=None):
         """
         Transcribe video using local Whisper model (FREE).
         
         Args:
             key (str): Original S3 key (filename)
-            content (bytes): Video file content
+            video_path (str): Local path of the downloaded video
+            language (str, optional): Pinned language code, None to auto-detect
             
         Returns:
             str: Transcribed text or None if failed
@@ -159,26 +270,11 @@ class VideoService:
         self.logger.info(f"Processing video: {key}")
         
         try:
-            _, ext = os.path.splitext(key)
-            ext = ext.lower()
-            
-            # Supported video formats
-            supported_formats = ['.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv']
-            if ext not in supported_formats:
-                self.logger.warning(f"Unsupported video format: {ext}")
-                raise ValueError(f"Unsupported video format: {ext}")
-
-            # Save video to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_video:
-                tmp_video.write(content)
-                video_path = tmp_video.name
+            self._check_video_format(key)
 
             # Transcribe using local Whisper
             self.logger.info(f"Transcribing video with Whisper (this may take a while)...")
-            transcript = self._transcribe_with_whisper(video_path)
-
-            # Clean up temporary file
-            os.remove(video_path)
+            transcript = self._transcribe_with_whisper(video_path, language)
 
             return transcript
 
@@ -186,14 +282,30 @@ class VideoService:
             self.logger.error(f"Error processing video {key}: {e}")
             raise
 
-    def _transcribe_with_whisper(self, video_path):
+    def _check_video_format(self, key):
+        """
+        Raises:
+            ValueError: If the file extension is not a supported video format
+        """
+        _, ext = os.path.splitext(key)
+        ext = ext.lower()
+
+        # Supported video formats
+        supported_formats = ['.mp4', '.avi', '.mov', '.mkv', '.webm', '.flv', '.wmv']
+        if ext not in supported_formats:
+            self.logger.warning(f"Unsupported video format: {ext}")
+            raise ValueError(f"Unsupported video format: {ext}")
+
+    def _transcribe_with_whisper(self, video_path, language=None):
         """
         Transcribe video using local Whisper model.
         
-        Whisper automatically extracts audio from video files.
+        The audio track is decoded to 16 kHz mono once, split at silence and the
+        segments are transcribed in parallel, then stitched back in timeline order.
         
         Args:
             video_path (str): Path to video file
+            language (str, optional): Language code, None to auto-detect
             
         Returns:
             str: Transcribed text
@@ -202,18 +314,19 @@ class VideoService:
             Exception: If transcription fails or returns empty transcript
         """
         try:
-            # Whisper automatically handles video files and extracts audio
-            result = self.whisper_model.transcribe(
+            report = {}
+            segments = self.iter_transcript_segments(
                 video_path,
-                language=None,  # Auto-detect language (or set to "en", "vi", etc.)
-                verbose=True,  # Prints detailed progress
-                fp16=False  # Set to True if you have a GPU
+                language=language,  # None = auto-detect (or "en", "vi", etc.)
+                report=report
             )
             
-            transcript = result["text"].strip()
+            transcript = " ".join(segment["text"] for segment in segments).strip()
             
             if transcript:
-                self.logger.info(f"Whisper transcription complete: {len(transcript)} chars")
+                if report:
+                    self.logger.info(f"Whisper transcription complete: {len(transcript)} chars, "
+                                     f"{report['duration']:.0f}s audio, RTF {report['rtf']:.2f}")
                 return transcript
             else:
                 self.logger.error("Empty transcript from Whisper")
@@ -223,13 +336,14 @@ class VideoService:
             self.logger.error(f"Whisper transcription error: {e}")
             raise
 
-    def chunk_video_transcript(self, video_id, transcript):
+    def chunk_video_transcript(self, video_id, transcript, project_id=None):
         """
         Chunk and embed video transcript using EmbeddingService.
         
         Args:
             video_id (str): Video ID from Project Service
             transcript (str): Transcribed text from video
+            project_id (str, optional): Project ID that contains this video
             
         Returns:
             int: Number of chunks created
@@ -238,7 +352,7 @@ class VideoService:
             Exception: If embedding fails
         """
         try:
-            num_chunks = self.embedding_service.chunk_and_embed_video(video_id, transcript)
+            num_chunks = self.embedding_service.chunk_and_embed_video(video_id, transcript, project_id)
             self.logger.info(f"Video {video_id}: {num_chunks} transcript chunks embedded")
             return num_chunks
         except Exception as e:
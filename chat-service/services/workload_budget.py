@@ -0,0 +1,103 @@
+"""
+CPU budgets and latency metrics per workload class.
+
+torch's intra-op thread pool is process-wide, so the three CPU-heavy workloads of
+this service are separated like this:
+- query_embedding: chat queries, in the API process, QUERY_EMBED_THREADS threads
+- ingestion_embedding: chunk embedding, INGEST_EMBED_THREADS threads
+- transcription: Whisper, TRANSCRIBE_THREADS threads per worker
+
+With WORKLOAD_ISOLATION=true ingestion embedding and transcription always run in
+their own worker processes, each pinned to its budget, so they can't steal the query
+pool's threads. It is off unless set; main.py turns it on only when the API and the
+listeners share one process (role all on the dev server).
+"""
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+QUERY_EMBEDDING = "query_embedding"
+INGESTION_EMBEDDING = "ingestion_embedding"
+TRANSCRIPTION = "transcription"
+
+THREAD_SETTINGS = {
+    QUERY_EMBEDDING: "QUERY_EMBED_THREADS",
+    INGESTION_EMBEDDING: "INGEST_EMBED_THREADS",
+    TRANSCRIPTION: "TRANSCRIBE_THREADS",
+}
+
+_stats = {
+    workload: {"calls": 0, "failed": 0, "in_flight": 0, "busy_seconds": 0.0, "latencies": deque(maxlen=1000)}
+    for workload in THREAD_SETTINGS
+}
+_stats_lock = threading.Lock()
+
+
+def threads(workload):
+    """Thread budget of a workload class; 0 means the library default."""
+    return int(os.getenv(THREAD_SETTINGS[workload], 0))
+
+
+def isolated():
+    """Whether background workloads must run in separate processes."""
+    return os.getenv("WORKLOAD_ISOLATION", "false").lower() == "true"
+
+
+@contextmanager
+def track(workload):
+    """Record the latency of one unit of work of a workload class."""
+    stats = _stats[workload]
+    with _stats_lock:
+        stats["in_flight"] += 1
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        with _stats_lock:
+            stats["in_flight"] -= 1
+        record(workload, time.perf_counter() - started, failed)
+
+
+def record(workload, seconds, failed=False):
+    """Record a unit of work measured elsewhere (e.g. inside a worker process)."""
+    stats = _stats[workload]
+    with _stats_lock:
+        stats["calls"] += 1
+        stats["failed"] += failed
+        stats["busy_seconds"] += seconds
+        stats["latencies"].append(seconds)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def snapshot():
+    """
+    Per-workload metrics: thread budget, calls, failures, work in flight and
+    p50/p99 latency (ms) over the last 1000 calls.
+    """
+    with _stats_lock:
+        return {
+            workload: {
+                "threads": threads(workload),
+                "isolated": isolated() and workload != QUERY_EMBEDDING,
+                "calls": stats["calls"],
+                "failed": stats["failed"],
+                "in_flight": stats["in_flight"],
+                "busy_seconds": round(stats["busy_seconds"], 3),
+                "p50_ms": round(_percentile(stats["latencies"], 0.5) * 1000, 1),
+                "p99_ms": round(_percentile(stats["latencies"], 0.99) * 1000, 1),
+            }
+            for workload, stats in _stats.items()
+        }
@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+pytest.importorskip("sentence_transformers")
+
+from services import embedding_backends
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Minimum cosine similarity to the torch reference on SAMPLE_TEXTS. fp32 ONNX runs the
+# same graph, so only float rounding differs; int8 weights cost a little accuracy.
+MIN_COSINE = {"fp32": 0.99, "int8": 0.95}
+
+
+@pytest.mark.parametrize("precision", ["fp32", "int8"])
+def test_onnx_matches_torch(precision, monkeypatch):
+    monkeypatch.setenv("EMBED_ONNX_INT8", "true" if precision == "int8" else "false")
+
+    agreement = embedding_backends.parity(MODEL_NAME, backend_name="onnx")
+
+    assert agreement["min"] >= MIN_COSINE[precision]
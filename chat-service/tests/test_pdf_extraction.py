@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+pytest.importorskip("PyPDF2")
+
+from services import pdf_extraction
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+# Three text pages in Helvetica
+SAMPLE_PDF = os.path.join(FIXTURES, "sample.pdf")
+SAMPLE_PAGES = 3
+
+# Word-level similarity to the PyPDF2 output; engines differ only in whitespace and line breaks
+MIN_PARITY = 0.9
+
+
+def installed_backends():
+    return [
+        pytest.param(name, marks=pytest.mark.skipif(not backend.is_available(), reason=f"{name} is not installed"))
+        for name, backend in pdf_extraction.BACKENDS.items()
+    ]
+
+
+@pytest.mark.parametrize("backend_name", installed_backends())
+def test_backend_page_count_and_parity(backend_name):
+    backend = pdf_extraction.BACKENDS[backend_name]()
+    assert backend.page_count(SAMPLE_PDF) == SAMPLE_PAGES
+
+    pages = list(backend.iter_pages(SAMPLE_PDF, 0, SAMPLE_PAGES))
+    assert [page_num for page_num, _ in pages] == [1, 2, 3]
+    assert "ingestion pipeline" in pages[1][1]
+
+    result = pdf_extraction.benchmark([SAMPLE_PDF], [backend_name])[backend_name]
+    assert result["pages"] == SAMPLE_PAGES
+    assert result["parity"] >= MIN_PARITY
+
+
+def test_parallel_extraction_keeps_page_order(monkeypatch):
+    monkeypatch.setenv("PDF_EXTRACT_WORKERS", "2")
+    monkeypatch.setenv("PDF_MAX_INFLIGHT_RANGES", "1")
+    backend = pdf_extraction.PyPDF2Backend()
+
+    pages = list(pdf_extraction.iter_pages_parallel(backend, SAMPLE_PDF, SAMPLE_PAGES, pages_per_task=1))
+
+    assert pages == list(backend.iter_pages(SAMPLE_PDF, 0, SAMPLE_PAGES))
@@ -0,0 +1,71 @@
+import pytest
+
+from services.retrieval_router import HISTORY, RETRIEVE, RetrievalRouter
+
+
+@pytest.mark.parametrize("question, reason", [
+    ("thanks!", "small_talk"),
+    ("Thanks a lot 👍", "small_talk"),
+    ("ok", "small_talk"),
+    ("cảm ơn bạn", "small_talk"),
+    ("can you shorten that?", "rewrite"),
+    ("Please summarize it in 3 sentences", "rewrite"),
+    ("translate your last answer into Vietnamese", "rewrite"),
+    ("Rephrase what you said", "rewrite"),
+    ("Could you simplify this?", "rewrite"),
+    ("explain that again", "rewrite"),
+    ("tóm tắt câu trả lời trên", "rewrite"),
+])
+def test_follow_ups_are_answered_from_history(question, reason):
+    assert RetrievalRouter(mode="auto").route(question, has_history=True) == (HISTORY, reason)
+
+
+@pytest.mark.parametrize("question", [
+    "How do I expand this cluster?",
+    "What format is this?",
+    "Is it simpler to use Postgres?",
+    "Does it support bullet points?",
+    "What does this rewrite rule do?",
+    "Can you elaborate on that?",
+    "Summarize this document",
+    "Rewrite this function to use async",
+    "Translate the pricing section of the handbook",
+    "How do I configure the pool size?",
+    "Summarize the onboarding policy for contractors in the handbook",
+    # Replies to an offer in the previous answer ("do you want the steps from the deployment doc?")
+    "yes",
+    "Yes please",
+    "sure",
+    "yeah!",
+    "no",
+    "nope",
+])
+def test_questions_are_retrieved(question):
+    assert RetrievalRouter(mode="auto").route(question, has_history=True) == (RETRIEVE, "question")
+
+
+@pytest.mark.parametrize("mode, has_history, expected", [
+    ("auto", False, (RETRIEVE, "no_history")),
+    ("never", False, (RETRIEVE, "no_history")),
+    ("always", True, (RETRIEVE, "forced")),
+    ("never", True, (HISTORY, "forced")),
+])
+def test_modes(mode, has_history, expected):
+    assert RetrievalRouter(mode=mode).route("thanks!", has_history=has_history) == expected
+
+
+def test_override_and_stats():
+    router = RetrievalRouter(mode="auto")
+    router.route("thanks!", has_history=True)
+    router.route("thanks!", has_history=True, override="always")
+
+    stats = router.stats()
+    assert stats["turns"] == 2
+    assert stats["skipped"] == 1
+    assert stats["skip_rate"] == 0.5
+    assert stats["reasons"] == {"small_talk": 1, "forced": 1}
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        RetrievalRouter(mode="sometimes")
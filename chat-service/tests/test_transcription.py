@@ -0,0 +1,95 @@
+import os
+import math
+import wave
+import shutil
+import struct
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from services import transcription_service
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+# Short English speech clip (synthesised with espeak-ng, 16 kHz mono) and its
+# reference transcript, for the WER check
+SPEECH_CLIP = os.path.join(FIXTURES, "speech_clip.wav")
+SPEECH_REFERENCE = os.path.join(FIXTURES, "speech_clip.txt")
+
+MODEL_NAME = "tiny"
+# Synthetic speech is harder than a human voice for the tiny model
+MAX_WER = 0.3
+MAX_RTF = 2.0
+
+
+def installed_backends():
+    return [
+        pytest.param(name, marks=pytest.mark.skipif(not backend.is_available(), reason=f"{name} is not installed"))
+        for name, backend in transcription_service.BACKENDS.items()
+    ]
+
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+@pytest.mark.parametrize("reference, hypothesis, expected", [
+    ("the quick brown fox", "the quick brown fox", 0.0),
+    ("The quick, brown fox!", "the quick brown fox", 0.0),
+    ("the quick brown fox", "the quick fox", 0.25),
+    ("the quick brown fox", "a quick brown dog", 0.5),
+    ("", "", 0.0),
+    ("", "hello", 1.0),
+])
+def test_word_error_rate(reference, hypothesis, expected):
+    assert transcription_service.word_error_rate(reference, hypothesis) == pytest.approx(expected)
+
+
+def test_default_backend_is_openai_whisper(monkeypatch):
+    monkeypatch.delenv("TRANSCRIBE_BACKEND", raising=False)
+    if not transcription_service.OpenAIWhisperBackend.is_available():
+        pytest.skip("openai-whisper is not installed")
+    assert transcription_service.get_backend().name == "openai"
+
+
+def write_tone_clip(path, seconds=3.0):
+    """1s of silence, a tone burst, then silence again (16 kHz mono PCM)."""
+    rate = transcription_service.SAMPLE_RATE
+    with wave.open(path, "wb") as clip:
+        clip.setnchannels(1)
+        clip.setsampwidth(2)
+        clip.setframerate(rate)
+        frames = bytearray()
+        for i in range(int(seconds * rate)):
+            t = i / rate
+            value = 0.3 * math.sin(2 * math.pi * 220 * t) if 1.0 <= t < 2.0 else 0.0
+            frames += struct.pack("<h", int(value * 32767))
+        clip.writeframes(bytes(frames))
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize("backend_name", installed_backends())
+def test_transcription_smoke(backend_name, tmp_path):
+    clip = str(tmp_path / "tone.wav")
+    write_tone_clip(clip)
+    engine = transcription_service.TranscriptionEngine(model_name=MODEL_NAME, workers=1, backend=backend_name)
+    try:
+        result = engine.transcribe(clip, language="en")
+    finally:
+        engine.close()
+
+    assert result["duration"] == pytest.approx(3.0, abs=0.05)
+    assert 0 < result["rtf"] < MAX_RTF
+    for segment in result["segments"]:
+        assert 0 <= segment["start"] <= segment["end"] <= result["duration"] + 0.5
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize("backend_name", installed_backends())
+def test_speech_clip_wer(backend_name):
+    with open(SPEECH_REFERENCE, encoding="utf-8") as reference_file:
+        reference = reference_file.read()
+
+    result = transcription_service.benchmark(SPEECH_CLIP, reference, [backend_name], MODEL_NAME, "en")[backend_name]
+
+    assert result["wer"] <= MAX_WER
+    assert result["rtf"] < MAX_RTF
@@ -123,5 +123,12 @@ CREATE TABLE kb_chat.chat_messages (
                                        created_at TIMESTAMP
 );
 
+-- LangChain PGVector tables (public schema, created by langchain_postgres on first use).
+-- Per-source chunk lookups used by re-indexing and purges; apply once the tables exist.
+CREATE INDEX IF NOT EXISTS idx_langchain_pg_embedding_document_id
+    ON langchain_pg_embedding (collection_id, (cmetadata->>'document_id'));
+CREATE INDEX IF NOT EXISTS idx_langchain_pg_embedding_video_id
+    ON langchain_pg_embedding (collection_id, (cmetadata->>'video_id'));
+
 -- drop schema kb_project cascade;
 -- drop schema kb_user cascade;
\ No newline at end of file